@@ -1,9 +1,20 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
 from .config import Config
-from .models import db, User  # Import User here
+from .conversations import conversation_store
+from .database import init_db
+from .identity import identity_cache
+from .invitations import invite_revocations
+from .llm import init_llm
+from .ratelimit import rate_limiter
+from .metrics import init_metrics
+from .migrations import db_upgrade_command
+from .templating import init_templates
+from .mailer import mail_worker_command
+from .exporting import export_feedback_command
 from .auth import auth_bp
 from .command_center import command_center_bp
 from .feedback import feedback_bp
@@ -13,25 +24,37 @@ from .home import home_bp
 mail = Mail()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config_overrides=None):
     # Initialize the Flask app
     app = Flask(__name__)
 
     # Load the configurations
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    # Client address and scheme as seen by the trusted proxies
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
 
     # Set up extensions
-    db.init_app(app)
+    init_db(app)
     mail.init_app(app)
     login_manager.init_app(app)
+    conversation_store.init_app(app)
+    identity_cache.init_app(app)
+    invite_revocations.init_app(app)
+    init_llm(app)
+    rate_limiter.init_app(app)
 
     # Set login view
     login_manager.login_view = 'auth.login'
 
-    # Register user loader
+    # Register user loader; served from the identity cache when possible
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.get(User, int(user_id))  # Ensure User is imported
+        return identity_cache.load(int(user_id))
 
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -40,4 +63,15 @@ def create_app():
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
     app.register_blueprint(home_bp)
 
+    # Compile templates now rather than on the first request
+    init_templates(app)
+
+    # Request, SQL, LLM and mail instrumentation
+    init_metrics(app)
+
+    # CLI commands
+    app.cli.add_command(mail_worker_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(export_feedback_command)
+
     return app
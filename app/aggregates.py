@@ -0,0 +1,139 @@
+import hashlib
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from .models import db, Feedback, FeedbackGiver, FeedbackRollup, FeedbackStats
+from .llm import complete_chat
+from .prompting import ROLLUP_PROMPT, count_tokens
+
+
+def build_stats(user_id):
+    """Compute ``user_id``'s :class:`FeedbackStats` from the raw rows."""
+    sent, completed, last_activity_at = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(case((FeedbackGiver.completed.is_(True), 1), else_=0)), 0),
+               func.max(FeedbackGiver.completed_at))
+        .where(FeedbackGiver.user_id == user_id)
+    ).one()
+    last_feedback_id = db.session.scalar(
+        select(func.coalesce(func.max(Feedback.id), 0)).where(Feedback.user_id == user_id, Feedback.content != '')
+    )
+    return FeedbackStats(user_id=user_id, invites_sent=sent, invites_completed=completed,
+                         last_feedback_id=last_feedback_id, last_activity_at=last_activity_at)
+
+
+def _apply(user_id, **values):
+    # Counters are bumped in SQL so concurrent requests cannot lose updates;
+    # a user without a stats row yet gets one computed from scratch, which
+    # already includes this transaction's changes
+    result = db.session.execute(update(FeedbackStats).where(FeedbackStats.user_id == user_id).values(**values))
+    if result.rowcount == 0:
+        stats = build_stats(user_id)
+        stats.last_activity_at = values['last_activity_at']
+        db.session.add(stats)
+
+
+def record_invites(user_id, count):
+    """Count ``count`` new invitations. Takes effect when the caller commits."""
+    _apply(user_id, invites_sent=FeedbackStats.invites_sent + count,
+           last_activity_at=datetime.now(timezone.utc))
+
+
+def record_completion(user_id, feedback_id):
+    """Count a completed chat saved as ``feedback_id``. Takes effect when the caller commits."""
+    _apply(user_id, invites_completed=FeedbackStats.invites_completed + 1,
+           last_feedback_id=case((FeedbackStats.last_feedback_id < feedback_id, feedback_id),
+                                 else_=FeedbackStats.last_feedback_id),
+           last_activity_at=datetime.now(timezone.utc))
+
+
+def get_stats(user_id):
+    return db.session.get(FeedbackStats, user_id) or FeedbackStats(
+        user_id=user_id, invites_sent=0, invites_completed=0, last_feedback_id=0)
+
+
+def get_rollup(user_id):
+    return db.session.get(FeedbackRollup, user_id)
+
+
+def rollup_is_stale(stats, rollup):
+    return stats.last_feedback_id > (rollup.covered_feedback_id if rollup else 0)
+
+
+def _fold(summary, transcripts):
+    max_words = current_app.config['FEEDBACK_ROLLUP_MAX_WORDS']
+    conversations = '\n\n'.join(f'Conversation {number}:\n{content}'
+                                for number, (_, content) in enumerate(transcripts, 1))
+    return complete_chat([
+        {'role': 'system', 'content': ROLLUP_PROMPT.format(max_words=max_words)},
+        {'role': 'user', 'content': f'Existing overview:\n{summary or "(none)"}\n\nNew feedback:\n{conversations}'},
+    ], temperature=0.2)
+
+
+def _store_rollup(user_id, summary, content_hash, covered_feedback_id):
+    # Only ever moves a summary forward; when two refreshes race, whichever
+    # commits first wins and the other's write becomes a no-op
+    values = dict(summary=summary, content_hash=content_hash, covered_feedback_id=covered_feedback_id,
+                  generated_at=datetime.now(timezone.utc))
+    updated = db.session.execute(
+        update(FeedbackRollup)
+        .where(FeedbackRollup.user_id == user_id, FeedbackRollup.covered_feedback_id < covered_feedback_id)
+        .values(**values)
+    ).rowcount
+    try:
+        if not updated:
+            db.session.execute(insert(FeedbackRollup).values(user_id=user_id, **values))
+        db.session.commit()
+    except IntegrityError:
+        # The row exists and already covers at least as much
+        db.session.rollback()
+
+
+def refresh_rollup(user_id):
+    """Return ``user_id``'s overall feedback summary, updating it if new feedback arrived.
+
+    The summary only ever reads transcripts it has not seen: those newer
+    than ``covered_feedback_id`` are folded into the existing summary, in
+    as few LLM calls as ``LLM_PROMPT_TOKEN_BUDGET`` allows. ``content_hash``
+    chains the SHA-256 of every transcript folded in, so it identifies the
+    exact feedback a summary was built from (the JSON API uses it as the
+    ETag). With no new feedback this costs two primary-key lookups.
+
+    Nothing is written while an LLM call is in flight, so the SQLite write
+    lock is only held for the short upsert after each fold.
+    """
+    stats = get_stats(user_id)
+    rollup = get_rollup(user_id)
+    if not rollup_is_stale(stats, rollup):
+        return rollup
+
+    summary, content_hash, covered = (rollup.summary, rollup.content_hash, rollup.covered_feedback_id) \
+        if rollup else ('', '', 0)
+    last_feedback_id = stats.last_feedback_id
+    budget = current_app.config['LLM_PROMPT_TOKEN_BUDGET']
+    new_feedback = db.session.execute(
+        select(Feedback.id, Feedback.content)
+        .where(Feedback.user_id == user_id, Feedback.content != '', Feedback.id > covered)
+        .order_by(Feedback.id)
+    ).all()
+    # End the read transaction so no connection is held across LLM calls
+    db.session.rollback()
+
+    batch, batch_tokens = [], count_tokens(summary)
+    for position, (feedback_id, content) in enumerate(new_feedback):
+        batch.append((feedback_id, content))
+        batch_tokens += count_tokens(content)
+        last = position == len(new_feedback) - 1
+        if not last and batch_tokens + count_tokens(new_feedback[position + 1][1]) <= budget:
+            continue
+        summary = _fold(summary, batch)
+        for _, folded in batch:
+            content_hash = hashlib.sha256(f'{content_hash}\0{folded}'.encode('utf-8')).hexdigest()
+        # Keep each fold, so a failure later on does not repeat the earlier calls
+        _store_rollup(user_id, summary, content_hash, feedback_id)
+        batch, batch_tokens = [], count_tokens(summary)
+
+    if not new_feedback:
+        # The stats point past feedback that no longer exists
+        _store_rollup(user_id, summary, content_hash, last_feedback_id)
+    return db.session.get(FeedbackRollup, user_id, populate_existing=True)
@@ -0,0 +1,159 @@
+import asyncio
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from flask import url_for
+from .feedback import prepare_turn, retry_after_header, save_turn, sse_event
+from .invitations import authorize_invite
+from .llm import LLMError, get_llm
+from .mailer import start_mail_worker
+from .migrations import upgrade_database
+from .ratelimit import Rejection, forwarded_client, rate_limiter
+
+
+class AsyncChatApp:
+    """ASGI handler for the streaming chat turn.
+
+    The LLM round-trip, which is most of a chat turn, is awaited on the
+    event loop instead of holding a WSGI thread. The short database steps
+    (authorization, history, saving the turn) run in the default thread
+    pool inside an app context.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+
+    def _in_app_context(self, fn, *args):
+        with self.flask_app.app_context():
+            return fn(*args)
+
+    def _prepare(self, token, user_message, remote_addr):
+        # Returns (claims, messages, None) for an admitted turn, which must
+        # be released, or (None, None, reason or Rejection)
+        claims, reason = authorize_invite(token) if token else (None, 'invalid')
+        if claims is None:
+            return None, None, reason
+        rejection = rate_limiter.admit(claims.giver_id, claims.user_id, remote_addr)
+        if rejection is not None:
+            return None, None, rejection
+        try:
+            return claims, prepare_turn(claims.giver_id, user_message), None
+        except Exception:
+            rate_limiter.release()
+            raise
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        token = query.get('token', [None])[0]
+        body = b''
+        while True:
+            event = await receive()
+            body += event.get('body', b'')
+            if not event.get('more_body'):
+                break
+        user_message = parse_qs(body.decode('utf-8')).get('message', [''])[0]
+
+        forwarded_for = b','.join(value for name, value in scope.get('headers', []) if name == b'x-forwarded-for')
+        remote_addr = forwarded_client((scope.get('client') or (None,))[0], forwarded_for.decode('latin-1'),
+                                       self.flask_app.config['TRUSTED_PROXY_HOPS'])
+        claims, messages, reason = await asyncio.to_thread(self._in_app_context, self._prepare, token, user_message,
+                                                           remote_addr)
+        headers = [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]
+        rejection = reason if isinstance(reason, Rejection) else None
+        if rejection is not None:
+            status = rejection.status
+            headers.append((b'retry-after', retry_after_header(rejection).encode('latin-1')))
+        else:
+            status = 200 if claims is not None else 403
+        start = {'type': 'http.response.start', 'status': status, 'headers': headers}
+
+        async def emit(event, data, more=True):
+            await send({'type': 'http.response.body', 'body': sse_event(event, data).encode('utf-8'),
+                        'more_body': more})
+
+        if claims is None:
+            # Not admitted, so there is no slot to release
+            await send(start)
+            if rejection is not None:
+                await emit('error', rejection.message, more=False)
+            else:
+                message = ('Feedback has already been completed for this token.' if reason == 'completed'
+                           else 'Invalid or expired token.')
+                await emit('error', message, more=False)
+            return
+
+        parts = []
+        try:
+            # Sending fails if the client has gone away, which must not leak the slot
+            await send(start)
+            with self.flask_app.app_context():
+                llm = get_llm()
+            async for delta in llm.astream(messages):
+                parts.append(delta)
+                await emit('delta', delta)
+        except LLMError as e:
+            await emit('error', f'The assistant is unavailable right now, please try again. ({str(e)})', more=False)
+            return
+        finally:
+            rate_limiter.release()
+
+        await asyncio.to_thread(self._in_app_context, save_turn, claims.giver_id, user_message, ''.join(parts))
+        await emit('done', '', more=False)
+
+
+def _start_services(flask_app):
+    # What main.py does before serving, so `uvicorn asgi:app` needs nothing else.
+    # Every worker runs this: upgrade_database() holds an exclusive lock, so
+    # the first worker applies the migrations and the others find none
+    # pending, and workers share the outbox by claiming batches
+    with flask_app.app_context():
+        upgrade_database()
+    if flask_app.config['MAIL_WORKER_ENABLED'] and 'mail_worker' not in flask_app.extensions:
+        start_mail_worker(flask_app)
+
+
+def _stop_services(flask_app):
+    worker = flask_app.extensions.pop('mail_worker', None)
+    if worker is not None:
+        worker.stop(timeout=10)
+
+
+def create_asgi_app(flask_app):
+    """Serve ``flask_app`` over ASGI with a native async chat endpoint.
+
+    ``POST /feedback/feedback_stream`` is handled by :class:`AsyncChatApp`;
+    every other request goes to the regular Flask views through
+    ``WsgiToAsgi``, which runs them in a thread pool. Lifespan startup
+    applies pending migrations and starts the outbox mail worker (unless
+    ``MAIL_WORKER_ENABLED`` is off) in every server worker, which is safe
+    with ``uvicorn --workers``; shutdown stops the worker.
+    """
+    wsgi = WsgiToAsgi(flask_app)
+    chat = AsyncChatApp(flask_app)
+    with flask_app.test_request_context():
+        chat_path = url_for('feedback.feedback_stream')
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    try:
+                        await asyncio.to_thread(_start_services, flask_app)
+                    except Exception as e:
+                        await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                        return
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await asyncio.to_thread(_stop_services, flask_app)
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == chat_path:
+            await chat(scope, receive, send)
+        else:
+            await wsgi(scope, receive, send)
+
+    return application
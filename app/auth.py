@@ -1,7 +1,8 @@
-from flask import Blueprint, request, render_template_string, redirect, url_for, flash
+from flask import Blueprint, request, render_template, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
-from .models import db, User
-from flask_mail import Message
+from .models import db, User, FeedbackStats
+from .identity import identity_cache
+from .mailer import enqueue_mail
 from itsdangerous import URLSafeTimedSerializer
 
 auth_bp = Blueprint('auth', __name__)
@@ -42,48 +43,25 @@ def signup():
         # Create new user
         new_user = User(username=username, first_name=first_name, last_name=last_name, email=email, password=password, job_title=job_title, company=company)
         db.session.add(new_user)
+        db.session.add(FeedbackStats(user=new_user))
 
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            flash(f'An error occurred: {str(e)}', 'danger')
-
-        # Send verification email
+        # Queue the verification email; it is sent by the mail worker
         token = generate_verification_token(email)
         verify_url = url_for('auth.verify_email', token=token, _external=True)
-        msg = Message('Please verify your email', sender=('Feedback App', 'your_email_here@example.com'), recipients=[email])
-        msg.body = f'Click the link to verify your email: {verify_url}'
+        enqueue_mail('Please verify your email', [email],
+                     f'Click the link to verify your email: {verify_url}',
+                     sender=('Feedback App', 'your_email_here@example.com'))
 
         try:
-            mail.send(msg)
+            db.session.commit()
         except Exception as e:
-            flash(f'Failed to send email to {email}: {str(e)}', 'danger')
+            db.session.rollback()
+            flash(f'An error occurred: {str(e)}', 'danger')
 
         flash('Account created successfully. A verification email has been sent. Please verify your email to log in.', 'success')
         return redirect(url_for('auth.login'))
 
-    return render_template_string('''
-        <h1>Sign Up</h1>
-        <form method="POST">
-            <label for="first_name">First Name:</label><br>
-            <input type="text" id="first_name" name="first_name" required><br><br>
-            <label for="last_name">Last Name:</label><br>
-            <input type="text" id="last_name" name="last_name" required><br><br>
-            <label for="job_title">Job Title:</label><br>
-            <input type="text" id="job_title" name="job_title"><br><br>
-            <label for="company">Company:</label><br>
-            <input type="text" id="company" name="company"><br><br>
-            <label for="username">Username:</label><br>
-            <input type="text" id="username" name="username" required><br><br>
-            <label for="email">Email:</label><br>
-            <input type="email" id="email" name="email" required><br><br>
-            <label for="password">Password:</label><br>
-            <input type="password" id="password" name="password" required><br><br>
-            <input type="submit" value="Sign Up">
-        </form>
-        <a href="{{ url_for('auth.login') }}">Already have an account? Log in here</a>
-    ''')
+    return render_template('auth/signup.html')
 
 @auth_bp.route('/verify_email/<token>')
 def verify_email(token):
@@ -114,17 +92,7 @@ def login():
 
         flash('Invalid username or password. Please try again.', 'danger')
 
-    return render_template_string('''
-        <h1>Login</h1>
-        <form method="POST">
-            <label for="username">Username:</label><br>
-            <input type="text" id="username" name="username" required><br><br>
-            <label for="password">Password:</label><br>
-            <input type="password" id="password" name="password" required><br><br>
-            <input type="submit" value="Login">
-        </form>
-        <a href="{{ url_for('auth.signup') }}">Don't have an account? Sign up here</a>
-    ''')
+    return render_template('auth/login.html')
 
 @auth_bp.route('/logout')
 @login_required
@@ -137,31 +105,21 @@ def logout():
 @login_required
 def edit_profile():
     if request.method == 'POST':
-        current_user.first_name = request.form['first_name']
-        current_user.last_name = request.form['last_name']
-        current_user.job_title = request.form.get('job_title')
-        current_user.company = request.form.get('company')
+        # current_user is a cached read-only copy, so update the actual row
+        user = db.session.get(User, current_user.id)
+        user.first_name = request.form['first_name']
+        user.last_name = request.form['last_name']
+        user.job_title = request.form.get('job_title')
+        user.company = request.form.get('company')
 
         try:
             db.session.commit()
+            identity_cache.invalidate(user.id)
             flash('Profile updated successfully.', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'An error occurred: {str(e)}', 'danger')
         return redirect(url_for('command_center.command_center'))  # Updated redirect to command center
 
-    return render_template_string('''
-        <h1>Edit Profile</h1>
-        <form method="POST">
-            <label for="first_name">First Name:</label><br>
-            <input type="text" id="first_name" name="first_name" value="{{ current_user.first_name }}" required><br><br>
-            <label for="last_name">Last Name:</label><br>
-            <input type="text" id="last_name" name="last_name" value="{{ current_user.last_name }}" required><br><br>
-            <label for="job_title">Job Title:</label><br>
-            <input type="text" id="job_title" name="job_title" value="{{ current_user.job_title }}"><br><br>
-            <label for="company">Company:</label><br>
-            <input type="text" id="company" name="company" value="{{ current_user.company }}"><br><br>
-            <input type="submit" value="Update Profile">
-        </form>
-    ''')
+    return render_template('auth/edit_profile.html')
 
@@ -0,0 +1,14 @@
+import importlib
+
+
+def load_backend(name, builtins):
+    """Return the backend class configured as ``name``.
+
+    ``name`` is a key of ``builtins`` or a ``'package.module:Class'`` path,
+    so deployments can plug in their own class; it only needs a
+    ``from_config(config)`` constructor and the methods its caller uses.
+    """
+    if name in builtins:
+        return builtins[name]
+    module_name, _, class_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
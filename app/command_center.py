@@ -1,88 +1,67 @@
 # Define Blueprint for the command center
-from flask import Blueprint, render_template_string, request, flash, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
-from flask_mail import Message
-from .models import Feedback, FeedbackGiver, db
-import uuid
+from .aggregates import get_stats
+from .listing import list_feedback
+from .invitations import bulk_invite, parse_emails
 
 command_center_bp =Blueprint('command_center', __name__)
 
+MAX_FLASHED_PROBLEMS = 10
+
 @command_center_bp.route('/', methods=['GET', 'POST'])
 @login_required
 def command_center():
-    try:
-        # Query the database for feedbacks related to the current user
-        user_feedbacks = Feedback.query.filter_by(user_id=current_user.id).all()
-    except Exception as e:
-        # Handle database query errors
-        flash('Error fetching feedbacks: {}'.format(str(e)), 'danger')
-        user_feedbacks = []
-
     if request.method == 'POST':
         # Handle form submission to send email invitations
-        emails = request.form.getlist('emails')
-        mail = current_app.extensions.get('mail')
+        emails = parse_emails(request.form, request.files)
 
-        for email in emails:
-            try:
-                token = str(uuid.uuid4())
-                # Create a new FeedbackGiver entry
-                new_feedback_giver = FeedbackGiver(user_id=current_user.id, email=email, token=token)
-                db.session.add(new_feedback_giver)
-                db.session.commit()
+        results = bulk_invite(current_user.id, emails)
+        invited = [result for result in results if result.status == 'invited']
+        problems = [result for result in results if result.status != 'invited']
+        if len(invited) == 1:
+            flash(f'Invitation sent to {invited[0].email}.', 'success')
+        elif invited:
+            flash(f'Invitations sent to {len(invited)} addresses.', 'success')
 
-                # Create the corresponding Feedback entry
-                new_feedback = Feedback(user_id=current_user.id, giver_id=new_feedback_giver.id, content="")
-                db.session.add(new_feedback)
-                db.session.commit()
+        # Flashed messages live in the session cookie, so keep the list short
+        for result in problems[:MAX_FLASHED_PROBLEMS]:
+            if result.status in ('duplicate', 'already_invited'):
+                flash(f'Skipped {result.email}: {result.detail}', 'warning')
+            else:
+                flash(f'Failed to process email to {result.email}: {result.detail}', 'danger')
+        if len(problems) > MAX_FLASHED_PROBLEMS:
+            flash(f'...and {len(problems) - MAX_FLASHED_PROBLEMS} more addresses were not invited.', 'danger')
 
-                feedback_url = url_for('feedback.feedback_page', token=token, _external=True)
-                msg = Message(
-                    'Your Feedback Invitation',
-                    recipients=[email],
-                    body=f'''Hi there!
+        return redirect(url_for('command_center.command_center'))
 
-                            You have been invited to provide feedback. Please use the following link to submit your feedback:
-                            {feedback_url}
+    try:
+        # Query the database for one page of feedbacks related to the current user
+        page = list_feedback(current_user.id, before=request.args.get('before', type=int))
+        user_feedbacks, next_before = page.items, page.next_before
+    except Exception as e:
+        # Handle database query errors
+        flash('Error fetching feedbacks: {}'.format(str(e)), 'danger')
+        user_feedbacks, next_before = [], None
 
-                            Thanks,
-                            The Feedback Team'''
-                )
-                mail.send(msg)
-                flash(f'Invitation sent to {email}.', 'success')
-            except Exception as e:
-                db.session.rollback()  # Roll back on error to maintain consistency
-                flash(f'Failed to process email to {email}: {str(e)}', 'danger')
+    # Render existing feedbacks or form for sending invitations
+    return render_template('command_center/index.html', user_feedbacks=user_feedbacks, next_before=next_before,
+                           stats=get_stats(current_user.id))
 
-        return redirect(url_for('command_center.command_center'))
+# JSON variant of the invitation form, returning a per-address report
+@command_center_bp.route('/invitations', methods=['POST'])
+@login_required
+def invitations():
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        emails = payload.get('emails', []) if isinstance(payload, dict) else None
+        if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+            return jsonify({'error': 'Expected a JSON object with "emails": a list of email addresses.'}), 400
+    else:
+        emails = parse_emails(request.form, request.files)
 
-    # Render existing feedbacks or form for sending invitations
-    return render_template_string('''
-        <h1>Command Center</h1>
-        <h2>Welcome, {{ current_user.first_name }} {{ current_user.last_name }}</h2>
-        <h3>Your Feedbacks</h3>
-        {% if user_feedbacks %}
-            <ul>
-            {% for feedback in user_feedbacks %}
-                <li>{{ feedback.content }}</li>
-            {% endfor %}
-            </ul>
-        {% else %}
-            <p>No feedbacks available.</p>
-        {% endif %}
-        <h3>Invite Feedback Providers</h3>
-        <form method="POST">
-            {% with messages = get_flashed_messages(with_categories=true) %}
-                {% if messages %}
-                    <ul class=flashes>
-                        {% for category, message in messages %}
-                            <li class="{{ category }}">{{ message }}</li>
-                        {% endfor %}
-                    </ul>
-                {% endif %}
-            {% endwith %}
-            <label for="emails">Enter email addresses:</label><br>
-            <input type="email" name="emails" multiple><br><br>
-            <input type="submit" value="Send Invitations">
-        </form>
-    ''', user_feedbacks=user_feedbacks)
\ No newline at end of file
+    results = bulk_invite(current_user.id, emails)
+    return jsonify({
+        'invited': sum(1 for result in results if result.status == 'invited'),
+        'results': [result._asdict() for result in results],
+    })
@@ -1,12 +1,136 @@
 import os
 
+# Published with the source, so it must never sign anything that grants access
+INSECURE_SECRET_KEY = 'supersecretkey'
+
 class Config:
-    SECRET_KEY = 'supersecretkey'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///users.db'
+    SECRET_KEY = os.getenv('SECRET_KEY', INSECURE_SECRET_KEY)
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///users.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')  # 'wsgi' (app.run) or 'asgi' (uvicorn)
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.getenv('EMAIL_USER')
     MAIL_PASSWORD = os.getenv('EMAIL_PASS')
     MAIL_DEFAULT_SENDER = ('Feedback App', os.getenv('EMAIL_USER'))
+
+    # 'eager' does one-off work (template compilation, LLM SDK import) in
+    # create_app(); 'lazy' defers it to first use, for scale-to-zero deployments
+    # where startup time adds directly to the first request
+    STARTUP_MODE = os.getenv('STARTUP_MODE', 'eager')
+
+    # LLM backend: 'openai' for the real API, 'fake' for the local stand-in
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+    LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4o')
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))  # deadline for a whole reply, in seconds
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+    LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))
+    LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '8'))
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))  # in-flight calls per process
+    LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', '256'))  # same, for the ASGI chat endpoint
+    LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '5'))
+    LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+    LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', '30'))
+    FAKE_LLM_FIRST_TOKEN_DELAY = float(os.getenv('FAKE_LLM_FIRST_TOKEN_DELAY', '0.5'))
+    FAKE_LLM_TOKEN_DELAY = float(os.getenv('FAKE_LLM_TOKEN_DELAY', '0.02'))
+    FAKE_LLM_REPLY = ("Thanks for sharing that. You mentioned: \"{message}\". "
+                      "Can you tell me about a specific moment where that showed up, "
+                      "and how the people around them responded?")
+    FAKE_LLM_FAILURE_RATE = float(os.getenv('FAKE_LLM_FAILURE_RATE', '0'))
+    FAKE_LLM_SEED = int(os.getenv('FAKE_LLM_SEED', '0'))
+
+    # Number of conversations kept in each worker's in-memory LRU cache
+    CONVERSATION_CACHE_SIZE = int(os.getenv('CONVERSATION_CACHE_SIZE', '1024'))
+
+    # Prompt assembly: token budget for each chat request and how many of the
+    # latest turns are always sent verbatim; older turns are summarized.
+    LLM_PROMPT_TOKEN_BUDGET = int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', '6000'))
+    LLM_RECENT_TURNS = int(os.getenv('LLM_RECENT_TURNS', '8'))
+    LLM_SUMMARY_MAX_WORDS = int(os.getenv('LLM_SUMMARY_MAX_WORDS', '250'))
+    FEEDBACK_ROLLUP_MAX_WORDS = int(os.getenv('FEEDBACK_ROLLUP_MAX_WORDS', '300'))
+
+    # Outbox mail worker
+    MAIL_WORKER_ENABLED = os.getenv('MAIL_WORKER_ENABLED', '1') == '1'
+    MAIL_WORKER_POLL_INTERVAL = float(os.getenv('MAIL_WORKER_POLL_INTERVAL', '2'))
+    MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', '50'))
+    MAIL_RATE_LIMIT = float(os.getenv('MAIL_RATE_LIMIT', '10'))  # messages per second, 0 for no limit
+    MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', '5'))
+    MAIL_RETRY_BASE_DELAY = float(os.getenv('MAIL_RETRY_BASE_DELAY', '30'))
+    MAIL_RETRY_MAX_DELAY = float(os.getenv('MAIL_RETRY_MAX_DELAY', '3600'))
+    MAIL_CLAIM_TIMEOUT = float(os.getenv('MAIL_CLAIM_TIMEOUT', '300'))
+
+    # Feedback listings (dashboard, command center, JSON API)
+    FEEDBACK_PAGE_SIZE = int(os.getenv('FEEDBACK_PAGE_SIZE', '25'))
+    FEEDBACK_PREVIEW_CHARS = int(os.getenv('FEEDBACK_PREVIEW_CHARS', '300'))
+
+    # Database engine profile: 'production' enables WAL, tuned pragmas and a
+    # connection pool sized for threaded servers; 'default' uses SQLAlchemy's defaults
+    DB_ENGINE_PROFILE = os.getenv('DB_ENGINE_PROFILE', 'production')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'synchronous': 'NORMAL',
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        'temp_store': 'MEMORY',
+        'cache_size': -20000,  # in KiB
+    }
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+    # Templates are compiled once at startup; set a directory to also keep
+    # the compiled bytecode across restarts
+    TEMPLATES_PRECOMPILE = os.getenv('TEMPLATES_PRECOMPILE', '1' if STARTUP_MODE == 'eager' else '0') == '1'
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR')
+    PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '300'))
+
+    # Per-process cache of the logged-in user's profile fields
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '4096'))
+    IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', '60'))
+
+    # Signed invitation links
+    INVITE_TOKEN_MAX_AGE = int(os.getenv('INVITE_TOKEN_MAX_AGE', str(30 * 24 * 3600)))
+    INVITE_REVOCATION_REFRESH = float(os.getenv('INVITE_REVOCATION_REFRESH', '30'))
+
+    # Instrumentation: Prometheus metrics at METRICS_PATH (optionally behind a
+    # bearer token), slow-query logging, and sampled stacks for slow requests
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+    METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', '0.25'))
+    PROFILE_SLOW_REQUESTS = os.getenv('PROFILE_SLOW_REQUESTS', '0') == '1'
+    PROFILE_SLOW_REQUEST_THRESHOLD = float(os.getenv('PROFILE_SLOW_REQUEST_THRESHOLD', '1.0'))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_MAX_STACKS = int(os.getenv('PROFILE_MAX_STACKS', '20'))
+
+    # Feedback exports; the admin-wide HTTP export needs this bearer token
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+    EXPORT_TOKEN = os.getenv('EXPORT_TOKEN')
+
+    # Full-text search: words of context shown around each match
+    SEARCH_SNIPPET_TOKENS = int(os.getenv('SEARCH_SNIPPET_TOKENS', '16'))
+
+    # Number of reverse proxies in front of the app (Cloud Run has one) whose
+    # X-Forwarded-For and X-Forwarded-Proto headers are trusted; 0 uses the
+    # socket's peer address, which behind a proxy is the proxy's
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+    # Chat turn rate limits per invitation, per user the feedback is about
+    # and per client IP, as '<requests>/<second|minute|hour|day>' (the burst
+    # is the full count); empty disables one. The IP limit is off by default
+    # because without TRUSTED_PROXY_HOPS every client behind a proxy shares
+    # one address. 'database' shares the buckets between workers through the
+    # rate_limit_bucket table
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_INVITE = os.getenv('RATE_LIMIT_INVITE', '10/minute')
+    RATE_LIMIT_USER = os.getenv('RATE_LIMIT_USER', '120/minute')
+    RATE_LIMIT_IP = os.getenv('RATE_LIMIT_IP', '')
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+    RATE_LIMIT_BUCKET_TTL = float(os.getenv('RATE_LIMIT_BUCKET_TTL', '86400'))
+    # Chat turns admitted at once per process; more are refused with a 503.
+    # 0 derives it from LLM_MAX_CONCURRENCY (or LLM_ASYNC_MAX_CONCURRENCY in ASGI mode)
+    LLM_ADMISSION_CAPACITY = int(os.getenv('LLM_ADMISSION_CAPACITY', '0'))
+    LLM_ADMISSION_RETRY_AFTER = float(os.getenv('LLM_ADMISSION_RETRY_AFTER', '2'))
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import select, delete
+from .models import db, ConversationTurn, ConversationSummary
+
+
+class ConversationStore:
+    """Server-side chat transcripts keyed by ``FeedbackGiver.id``.
+
+    Turns live in the ``conversation_turn`` table so every worker sees the
+    same transcript. Each worker keeps an LRU cache of the turns it has
+    already read together with the highest turn id seen; a lookup only asks
+    the database for turns newer than that id, so the per-request cost does
+    not grow with the length of the conversation.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # giver_id -> (last_turn_id, turns)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('CONVERSATION_CACHE_SIZE', self.max_entries)
+        app.extensions['conversation_store'] = self
+
+    def history(self, giver_id):
+        """Return the conversation as a list of ``{'role', 'content'}`` dicts."""
+        with self._lock:
+            last_id, turns = self._cache.get(giver_id, (0, []))
+
+        rows = db.session.execute(
+            select(ConversationTurn.id, ConversationTurn.role, ConversationTurn.content)
+            .where(ConversationTurn.giver_id == giver_id, ConversationTurn.id > last_id)
+            .order_by(ConversationTurn.id)
+        ).all()
+        if rows:
+            turns = turns + [{'role': row.role, 'content': row.content} for row in rows]
+            last_id = rows[-1].id
+
+        with self._lock:
+            current = self._cache.get(giver_id)
+            # Another thread may have caught up further in the meantime
+            if current is None or current[0] <= last_id:
+                self._cache[giver_id] = (last_id, turns)
+            self._cache.move_to_end(giver_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return list(turns)
+
+    def append(self, giver_id, role, content):
+        """Persist a single turn. The cache picks it up on the next lookup."""
+        self.extend(giver_id, [(role, content)])
+
+    def extend(self, giver_id, turns):
+        """Persist ``(role, content)`` turns in one transaction, in order."""
+        db.session.add_all([ConversationTurn(giver_id=giver_id, role=role, content=content)
+                            for role, content in turns])
+        db.session.commit()
+
+    def clear(self, giver_id):
+        """Delete the stored turns and summary for ``giver_id``.
+
+        The caller commits and then calls :meth:`evict`.
+        """
+        db.session.execute(delete(ConversationTurn).where(ConversationTurn.giver_id == giver_id))
+        db.session.execute(delete(ConversationSummary).where(ConversationSummary.giver_id == giver_id))
+
+    def evict(self, giver_id):
+        with self._lock:
+            self._cache.pop(giver_id, None)
+
+
+def format_transcript(history):
+    return "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
+
+
+conversation_store = ConversationStore()
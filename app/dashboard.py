@@ -1,25 +1,125 @@
-from flask import Blueprint, render_template_string
+import hmac
+from flask import (Blueprint, Response, render_template, request, jsonify, abort, current_app, flash,
+                   make_response, stream_with_context)
 from flask_login import login_required, current_user
-from .models import Feedback
+from .models import db, Feedback
+from .aggregates import get_rollup, get_stats, refresh_rollup, rollup_is_stale
+from .listing import list_feedback, feedback_to_dict
+from .llm import LLMError
+from .exporting import EXPORT_FORMATS, export_feedback
+from .search import search_feedback, search_hit_to_dict
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/dashboard', methods=['GET'])
 @login_required
 def dashboard():
-    # Display feedback for the user
-    feedbacks = Feedback.query.filter_by(user_id=current_user.id).all()
-
-    return render_template_string('''
-    <h2>Your Feedback</h2>
-    {% if feedbacks %}
-    <ul>
-      {% for feedback in feedbacks %}
-        <li><strong>From {{ feedback.giver.email }}:</strong> {{ feedback.content }}</li>
-      {% endfor %}
-    </ul>
-    {% else %}
-    <p>No feedback available yet.</p>
-    {% endif %}
-    <a href="{{ url_for('auth.logout') }}">Logout</a>
-    ''', feedbacks=feedbacks)
+    # Display one page of feedback for the user
+    page = list_feedback(current_user.id, before=request.args.get('before', type=int))
+    stats = get_stats(current_user.id)
+    rollup = get_rollup(current_user.id)
+
+    return render_template('dashboard/index.html', feedbacks=page.items, next_before=page.next_before,
+                           stats=stats, rollup=rollup, rollup_stale=rollup_is_stale(stats, rollup))
+
+@dashboard_bp.route('/summary', methods=['GET'])
+@login_required
+def summary():
+    # Regenerates the overall summary only if feedback arrived since the last one
+    try:
+        rollup = refresh_rollup(current_user.id)
+    except LLMError as e:
+        db.session.rollback()
+        flash(f'The summary could not be updated right now, please try again. ({str(e)})', 'danger')
+        rollup = get_rollup(current_user.id)
+    return render_template('dashboard/summary.html', stats=get_stats(current_user.id), rollup=rollup)
+
+@dashboard_bp.route('/api/summary', methods=['GET'])
+@login_required
+def summary_api():
+    try:
+        rollup = refresh_rollup(current_user.id)
+    except LLMError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503
+    stats = get_stats(current_user.id)
+    response = make_response(jsonify({
+        'invites_sent': stats.invites_sent,
+        'invites_completed': stats.invites_completed,
+        'invites_pending': stats.invites_pending,
+        'last_activity_at': stats.last_activity_at.isoformat() if stats.last_activity_at else None,
+        'summary': rollup.summary if rollup else None,
+        'content_hash': rollup.content_hash if rollup else None,
+    }))
+    if rollup is not None:
+        response.set_etag(rollup.content_hash)
+    return response.make_conditional(request)
+
+@dashboard_bp.route('/feedback/<int:feedback_id>', methods=['GET'])
+@login_required
+def feedback_detail(feedback_id):
+    feedback = db.session.get(Feedback, feedback_id)
+    if feedback is None or feedback.user_id != current_user.id:
+        abort(404)
+
+    return render_template('dashboard/feedback_detail.html', feedback=feedback)
+
+@dashboard_bp.route('/api/feedback', methods=['GET'])
+@login_required
+def feedback_api():
+    page = list_feedback(
+        current_user.id,
+        before=request.args.get('before', type=int),
+        limit=request.args.get('limit', type=int)
+    )
+    return jsonify({
+        'items': [feedback_to_dict(feedback) for feedback in page.items],
+        'next_before': page.next_before,
+    })
+
+@dashboard_bp.route('/search', methods=['GET'])
+@login_required
+def search():
+    q = request.args.get('q', '')
+    results = search_feedback(current_user.id, q, page=request.args.get('page', 1, type=int))
+    return render_template('dashboard/search.html', q=q, results=results)
+
+@dashboard_bp.route('/api/search', methods=['GET'])
+@login_required
+def search_api():
+    results = search_feedback(
+        current_user.id,
+        request.args.get('q', ''),
+        page=request.args.get('page', 1, type=int),
+        limit=request.args.get('limit', type=int)
+    )
+    return jsonify({
+        'items': [search_hit_to_dict(hit) for hit in results.hits],
+        'page': results.page,
+        'has_next': results.has_next,
+    })
+
+def _export_response(user_id=None):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    chunks = export_feedback(fmt, user_id=user_id, since_id=request.args.get('since_id', type=int))
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=feedback.{fmt}'
+    return response
+
+@dashboard_bp.route('/export', methods=['GET'])
+@login_required
+def export():
+    # ?format=csv|jsonl&since_id=<last exported id>
+    return _export_response(current_user.id)
+
+@dashboard_bp.route('/admin/export', methods=['GET'])
+def admin_export():
+    # Every user's feedback, for HR syncs; disabled unless EXPORT_TOKEN is set
+    token = current_app.config.get('EXPORT_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        abort(401)
+    return _export_response(request.args.get('user_id', type=int))
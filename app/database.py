@@ -0,0 +1,48 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from .models import db
+
+
+def _is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _set_sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+
+def init_db(app):
+    """Initialise Flask-SQLAlchemy with the configured engine profile.
+
+    The ``production`` profile is applied to file-backed SQLite databases:
+    a thread-safe connection pool sized for threaded servers and, on every
+    new connection, the pragmas in ``SQLITE_PRAGMAS`` (WAL journaling,
+    ``busy_timeout``, ``synchronous=NORMAL``, ``mmap_size``...). WAL lets
+    readers proceed while a write is in progress instead of queueing on
+    the database lock.
+    """
+    config = app.config
+    production = (config['DB_ENGINE_PROFILE'] == 'production'
+                  and _is_file_sqlite(config['SQLALCHEMY_DATABASE_URI']))
+
+    if production:
+        options = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('pool_size', config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        connect_args = options.setdefault('connect_args', {})
+        # Connections are handed between threads by the pool
+        connect_args.setdefault('check_same_thread', False)
+        connect_args.setdefault('timeout', config['SQLITE_PRAGMAS'].get('busy_timeout', 5000) / 1000)
+
+    db.init_app(app)
+
+    if production:
+        with app.app_context():
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas(config['SQLITE_PRAGMAS']))
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from .models import db, Feedback, FeedbackGiver
+
+EXPORT_COLUMNS = ('id', 'user_id', 'giver_id', 'giver_email', 'completed_at', 'content')
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _export_query(user_id=None, since_id=None):
+    query = (
+        select(Feedback.id, Feedback.user_id, Feedback.giver_id, FeedbackGiver.email.label('giver_email'),
+               FeedbackGiver.completed_at, Feedback.content)
+        .join(FeedbackGiver, FeedbackGiver.id == Feedback.giver_id)
+        # Skip the empty rows created alongside each invitation
+        .where(Feedback.content != '')
+        .order_by(Feedback.id)
+    )
+    if user_id is not None:
+        query = query.where(Feedback.user_id == user_id)
+    if since_id is not None:
+        query = query.where(Feedback.id > since_id)
+    return query
+
+
+def _record(row):
+    record = dict(row._mapping)
+    if record['completed_at'] is not None:
+        record['completed_at'] = record['completed_at'].isoformat()
+    return record
+
+
+def export_feedback(fmt, user_id=None, since_id=None, batch_size=None):
+    """Yield completed feedback transcripts as CSV or JSON Lines text, in id order.
+
+    Rows are fetched ``EXPORT_BATCH_SIZE`` at a time from a streaming
+    cursor and each batch is yielded as one chunk, so memory use does not
+    depend on the size of the export. Pass the largest ``id`` already
+    exported as ``since_id`` to fetch only newer transcripts.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format {fmt!r}')
+    batch_size = batch_size or current_app.config['EXPORT_BATCH_SIZE']
+    result = db.session.execute(
+        _export_query(user_id, since_id).execution_options(yield_per=batch_size, stream_results=True)
+    )
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_COLUMNS) if fmt == 'csv' else None
+    if writer is not None:
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    for partition in result.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        for row in partition:
+            if writer is not None:
+                writer.writerow(_record(row))
+            else:
+                buffer.write(json.dumps(_record(row)))
+                buffer.write('\n')
+        yield buffer.getvalue()
+
+
+@click.command('export-feedback')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='jsonl', show_default=True)
+@click.option('--user-id', type=int, help='Only export feedback received by this user.')
+@click.option('--since-id', type=int, help='Only export feedback with a larger id.')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='File to write (default: stdout).')
+@with_appcontext
+def export_feedback_command(fmt, user_id, since_id, output):
+    """Export completed feedback transcripts as CSV or JSON Lines."""
+    for chunk in export_feedback(fmt, user_id=user_id, since_id=since_id):
+        output.write(chunk)
+    output.flush()
@@ -1,90 +1,180 @@
-from flask import Blueprint, Flask, request, session, render_template_string, flash, redirect, url_for
+from flask import Blueprint, Response, request, session, render_template, flash, redirect, url_for, stream_with_context
 from .models import db, FeedbackGiver, Feedback
-import openai
-import os
-
-# Initialize the Flask app
-app = Flask(__name__)
-app.secret_key = 'supersecretkey'  # For session management
+from .aggregates import record_completion
+from .conversations import conversation_store, format_transcript
+from .invitations import authorize_invite, invite_revocations
+from .llm import LLMError, complete_chat, stream_chat
+from .prompting import build_prompt
+from .ratelimit import rate_limiter
+from datetime import datetime, timezone
+from sqlalchemy import update
+import json
+import math
 
 feedback_bp = Blueprint('feedback', __name__)
 
+
+def _authorize(token):
+    # Returns (claims, None) or (None, error_response)
+    if not token:
+        flash('Access token is required to view this page.', 'danger')
+        return None, redirect(url_for('home.index'))
+
+    claims, reason = authorize_invite(token)
+    if reason == 'invalid':
+        flash('Invalid or expired token.', 'danger')
+        return None, redirect(url_for('home.index'))
+
+    if reason == 'completed':
+        flash('Feedback has already been completed for this token.', 'warning')
+        return None, redirect(url_for('home.index'))
+
+    return claims, None
+
+
+def retry_after_header(rejection):
+    return str(math.ceil(rejection.retry_after))
+
+
 # Define the feedback route
 @feedback_bp.route('/feedback_page', methods=['GET', 'POST'])
 def feedback_page():
     try:
         # Token retrieval and validation
         token = request.args.get('token')
-        if not token:
-            flash('Access token is required to view this page.', 'danger')
-            return redirect(url_for('home.index'))
-
-        feedback_giver = FeedbackGiver.query.filter_by(token=token).first()
-        if not feedback_giver:
-            flash('Invalid or expired token.', 'danger')
-            return redirect(url_for('home.index'))
+        invite, error_response = _authorize(token)
+        if error_response is not None:
+            return error_response
 
-        if feedback_giver.completed:
-            flash('Feedback has already been completed for this token.', 'warning')
-            return redirect(url_for('home.index'))
-
-        session['giver_id'] = feedback_giver.id
+        session['giver_id'] = invite.giver_id
 
     except Exception as e:
         flash(f'Server Error: {str(e)}', 'danger')
-        return render_template_string('<p>Server error occurred. Please try again later.</p>')
+        return render_template('feedback/error.html')
+
+    conversation_history = conversation_store.history(invite.giver_id)
 
     # Handle POST requests
     if request.method == 'POST':
         user_message = request.form.get('message', '')
-        conversation_history = session.get('conversation_history', [])
 
         if 'end_chat' in request.form:
+            # Only the request that flips completed saves the transcript; a
+            # double submit or another worker that has not yet seen the
+            # revocation finds the row already completed
+            completed = db.session.execute(
+                update(FeedbackGiver)
+                .where(FeedbackGiver.id == invite.giver_id, FeedbackGiver.completed.isnot(True))
+                .values(completed=True, completed_at=datetime.now(timezone.utc))
+            ).rowcount
+            if completed != 1:
+                db.session.rollback()
+                invite_revocations.revoke(invite.giver_id)
+                flash('Feedback has already been completed for this token.', 'warning')
+                return redirect(url_for('home.index'))
+
             # Save the entire conversation and end chat
-            conversation_text = "\n".join(f"{msg['role']}: {msg['content']}" for msg in conversation_history)
+            conversation_text = format_transcript(conversation_history)
             new_feedback = Feedback(
                 content=conversation_text,
-                user_id=feedback_giver.user_id,
-                giver_id=feedback_giver.id
+                user_id=invite.user_id,
+                giver_id=invite.giver_id
             )
             db.session.add(new_feedback)
+            db.session.flush()
+            record_completion(invite.user_id, new_feedback.id)
+            conversation_store.clear(invite.giver_id)
 
             try:
                 db.session.commit()
+                conversation_store.evict(invite.giver_id)
+                invite_revocations.revoke(invite.giver_id)
                 flash('Chat ended and feedback saved.', 'success')
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error saving feedback: {str(e)}', 'danger')
 
-            session.pop('conversation_history', None)
             return redirect(url_for('home.index'))  # Redirect after saving
 
-        # Continue chat with AI
-        conversation_history.append({'role': 'user', 'content': user_message})
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an AI designed to help colleagues provide feedback on Foreign Service Officers (FSOs) in a relaxed, conversational style—like friends chatting over coffee or a beer. Your goal is to guide them through a story-driven feedback process, asking open-ended questions about leadership, communication, and handling challenges.Start by asking what the person providing feedback has worked on with the FSO. Encourage them to share specific examples, then follow up with thoughtful questions to dive deeper. Occasionally paraphrase or summarize their responses to show you're actively listening and understanding. Keep the conversation friendly and engaging, and after about 10 minutes, check in to see how they’re feeling, adjusting the pace if needed. As you wrap up, casually summarize the session, highlighting strengths, areas for growth, and suggest actionable next steps, inviting them to confirm or add to the summary."},
-                *conversation_history
-            ],
-            temperature=0.7
-        )
-        ai_message = response.choices[0].message.content
-        conversation_history.append({'role': 'assistant', 'content': ai_message})
-        session['conversation_history'] = conversation_history
+        rejection = rate_limiter.admit(invite.giver_id, invite.user_id, request.remote_addr)
+        if rejection is not None:
+            flash(rejection.message, 'warning')
+            return render_template('feedback/chat.html', conversation_history=conversation_history, token=token), \
+                rejection.status, {'Retry-After': retry_after_header(rejection)}
+
+        # Continue chat with AI; both turns are saved only once the reply is in
+        pending_history = conversation_history + [{'role': 'user', 'content': user_message}]
+        try:
+            messages, _ = build_prompt(invite.giver_id, pending_history)
+            ai_message = complete_chat(messages)
+        except LLMError as e:
+            flash(f'The assistant is unavailable right now, please try again. ({str(e)})', 'danger')
+        else:
+            save_turn(invite.giver_id, user_message, ai_message)
+            conversation_history = pending_history + [{'role': 'assistant', 'content': ai_message}]
+        finally:
+            rate_limiter.release()
 
     # Display the chat and form
-    return render_template_string('''
-        <h1>Chat with AI</h1>
-        <div id="chatbox">
-            {% for msg in conversation_history %}
-                <p><strong>{{ msg['role'].capitalize() }}:</strong> {{ msg['content'] }}</p>
-            {% endfor %}
-        </div>
-        <form method="POST">
-            <label for="message">Your message:</label><br>
-            <textarea id="message" name="message" rows="4" cols="50" required></textarea><br><br>
-            <input type="submit" name="send" value="Send">
-            <input type="submit" name="end_chat" value="End Chat and Save">
-        </form>
-    ''', conversation_history=session.get('conversation_history', []))
\ No newline at end of file
+    return render_template('feedback/chat.html', conversation_history=conversation_history, token=token)
+
+
+def prepare_turn(giver_id, user_message):
+    """Build the LLM messages for the next turn of ``giver_id``'s chat."""
+    conversation_history = conversation_store.history(giver_id)
+    conversation_history.append({'role': 'user', 'content': user_message})
+    messages, _ = build_prompt(giver_id, conversation_history)
+    return messages
+
+
+def save_turn(giver_id, user_message, reply):
+    conversation_store.extend(giver_id, [('user', user_message), ('assistant', reply)])
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Streaming variant of the chat turn: sends the reply as Server-Sent Events
+@feedback_bp.route('/feedback_stream', methods=['POST'])
+def feedback_stream():
+    token = request.args.get('token')
+    invite, error_response = _authorize(token)
+    if error_response is not None:
+        return error_response
+
+    giver_id = invite.giver_id
+    rejection = rate_limiter.admit(giver_id, invite.user_id, request.remote_addr)
+    if rejection is not None:
+        # Refused before the stream starts, so the status code still applies
+        return Response(sse_event('error', rejection.message), status=rejection.status,
+                        mimetype='text/event-stream', headers={'Retry-After': retry_after_header(rejection)})
+
+    user_message = request.form.get('message', '')
+    try:
+        messages = prepare_turn(giver_id, user_message)
+    except Exception:
+        rate_limiter.release()
+        raise
+
+    def generate():
+        parts = []
+        try:
+            for delta in stream_chat(messages):
+                parts.append(delta)
+                yield sse_event('delta', delta)
+        except LLMError as e:
+            yield sse_event('error', f'The assistant is unavailable right now, please try again. ({str(e)})')
+            return
+
+        # Save the turn once the stream has completed
+        save_turn(giver_id, user_message, ''.join(parts))
+        yield sse_event('done', '')
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # The server closes the response even if the client disconnects before
+    # the generator has started, which a finally inside it would miss
+    response.call_on_close(rate_limiter.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
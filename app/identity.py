@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import select
+from .models import db, User
+
+# The columns views read from ``current_user``; the password is never cached
+IDENTITY_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'job_title', 'company')
+
+
+class CachedUser(UserMixin):
+    """Read-only stand-in for ``User`` used as ``current_user``.
+
+    Load the ``User`` row explicitly before changing a profile.
+    """
+
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+        return f'<CachedUser {self.id}>'
+
+
+class IdentityCache:
+    """Per-process TTL/LRU cache behind the Flask-Login user loader.
+
+    Entries expire after ``IDENTITY_CACHE_TTL`` seconds, which bounds how
+    long another worker can serve a stale profile; within this process
+    :meth:`invalidate` drops an entry as soon as the profile changes.
+    """
+
+    def __init__(self, max_entries=4096, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # user_id -> (expires_at, fields)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('IDENTITY_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', self.ttl)
+        app.extensions['identity_cache'] = self
+
+    def load(self, user_id):
+        """Return a :class:`CachedUser` for ``user_id`` or ``None``."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return CachedUser(entry[1])
+            self.misses += 1
+
+        row = db.session.execute(
+            select(*(getattr(User, field) for field in IDENTITY_FIELDS)).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+
+        fields = dict(row._mapping)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, fields)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return CachedUser(fields)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,258 @@
+import csv
+import io
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+from flask import current_app, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import func, insert, select
+from .config import INSECURE_SECRET_KEY
+from .mailer import outbox_row
+from .models import db, Feedback, FeedbackGiver, OutboxMessage
+from .aggregates import record_invites
+
+EMAIL_RE = re.compile(r'^[^@\s,;]+@[^@\s,;]+\.[^@\s,;]+$')
+SEPARATORS_RE = re.compile(r'[\s,;]+')
+
+# Status is one of: invited, invalid, duplicate, already_invited, failed
+InviteResult = namedtuple('InviteResult', ['email', 'status', 'detail'])
+
+# What a chat turn needs to know about an invitation; expires_at is None for
+# legacy random tokens that were looked up in the database
+InviteClaims = namedtuple('InviteClaims', ['giver_id', 'user_id', 'expires_at'])
+
+
+def signed_invites_enabled(app=None):
+    """Whether ``SECRET_KEY`` is private, so signed invitation tokens cannot be forged."""
+    return (app or current_app).config['SECRET_KEY'] not in (None, '', INSECURE_SECRET_KEY)
+
+
+def _token_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='feedback-invite-salt')
+
+
+def generate_invite_token(giver_id, user_id, max_age=None):
+    """Signed, self-describing invitation token carrying the giver, owner and expiry.
+
+    Raises ``RuntimeError`` unless :func:`signed_invites_enabled`.
+    """
+    if not signed_invites_enabled():
+        raise RuntimeError('Set SECRET_KEY to issue signed invitation tokens')
+    if max_age is None:
+        max_age = current_app.config['INVITE_TOKEN_MAX_AGE']
+    return _token_serializer().dumps({'g': giver_id, 'u': user_id, 'e': int(time.time() + max_age)})
+
+
+def load_invite_token(token):
+    """Return :class:`InviteClaims` for a valid signed token, or ``None``.
+
+    Raises ``BadSignature`` if ``token`` is not a signed invitation token at
+    all, or if signed tokens are disabled because ``SECRET_KEY`` is the public
+    default.
+    """
+    if not signed_invites_enabled():
+        raise BadSignature('Signed invitation tokens are disabled')
+    payload = _token_serializer().loads(token)
+    if payload['e'] < time.time():
+        return None
+    return InviteClaims(payload['g'], payload['u'], payload['e'])
+
+
+def authorize_invite(token):
+    """Resolve an invitation token to :class:`InviteClaims`.
+
+    Signed tokens are checked without touching the database; only tokens
+    that are expired or whose giver is in the revocation set are refused.
+    Random tokens from before signed tokens existed are looked up.
+
+    Returns ``(claims, None)`` or ``(None, reason)`` with reason one of
+    ``invalid`` or ``completed``.
+    """
+    try:
+        claims = load_invite_token(token)
+    except BadSignature:
+        giver = FeedbackGiver.query.filter_by(token=token).first()
+        if giver is None:
+            return None, 'invalid'
+        if giver.completed:
+            return None, 'completed'
+        return InviteClaims(giver.id, giver.user_id, None), None
+
+    if claims is None:
+        return None, 'invalid'
+    if invite_revocations.is_revoked(claims.giver_id):
+        return None, 'completed'
+    return claims, None
+
+
+class InviteRevocations:
+    """In-memory set of giver ids whose invitation can no longer be used.
+
+    It mirrors ``FeedbackGiver.completed``. Completions in this process are
+    added immediately through :meth:`revoke`; completions by other workers
+    are picked up every ``INVITE_REVOCATION_REFRESH`` seconds by reading
+    only the rows completed since the previous refresh. Only completions
+    within the last ``INVITE_TOKEN_MAX_AGE`` are kept, since older tokens
+    have expired anyway.
+    """
+
+    # Allowance for clock differences between workers writing completed_at
+    CLOCK_SKEW = timedelta(seconds=5)
+
+    def __init__(self, refresh_interval=30.0, max_age=30 * 24 * 3600):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._revoked = OrderedDict()  # giver_id -> time.time() when it was seen completed
+        self._synced_at = None
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('INVITE_REVOCATION_REFRESH', self.refresh_interval)
+        self.max_age = app.config.get('INVITE_TOKEN_MAX_AGE', self.max_age)
+        # The set mirrors the database of this app, so start over from it
+        with self._lock:
+            self._revoked.clear()
+            self._synced_at = None
+            self._next_refresh = 0.0
+        app.extensions['invite_revocations'] = self
+        if not signed_invites_enabled(app):
+            app.logger.warning('SECRET_KEY is not set; invitation links use database tokens instead of signed ones')
+
+    def is_revoked(self, giver_id):
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+        return giver_id in self._revoked
+
+    def revoke(self, giver_id):
+        with self._lock:
+            self._revoked[giver_id] = time.time()
+
+    def refresh(self):
+        now = datetime.now(timezone.utc)
+        since = self._synced_at if self._synced_at is not None else now - timedelta(seconds=self.max_age)
+        ids = db.session.scalars(
+            select(FeedbackGiver.id).where(FeedbackGiver.completed_at >= since - self.CLOCK_SKEW)
+        ).all()
+        seen = time.time()
+        with self._lock:
+            for giver_id in ids:
+                self._revoked.setdefault(giver_id, seen)
+            # Entries are in the order they were seen; a token issued before
+            # its giver completed has expired max_age after that
+            cutoff = seen - self.max_age - self.CLOCK_SKEW.total_seconds()
+            while self._revoked and next(iter(self._revoked.values())) < cutoff:
+                self._revoked.popitem(last=False)
+            self._synced_at = now
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+
+invite_revocations = InviteRevocations()
+
+
+def parse_emails(form, files=None):
+    """Collect addresses from the ``emails`` form fields and an optional CSV upload."""
+    emails = []
+    for value in form.getlist('emails'):
+        emails.extend(part for part in SEPARATORS_RE.split(value) if part)
+
+    upload = files.get('csv_file') if files else None
+    if upload and upload.filename:
+        text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace')
+        for row in csv.reader(text):
+            # Take every cell that looks like an address, so header rows and
+            # extra columns such as names are ignored
+            emails.extend(cell.strip() for cell in row if '@' in cell)
+    return emails
+
+
+def invitation_body(feedback_url):
+    return f'''Hi there!
+
+                You have been invited to provide feedback. Please use the following link to submit your feedback:
+                {feedback_url}
+
+                Thanks,
+                The Feedback Team'''
+
+
+def bulk_invite(user_id, emails):
+    """Invite every address in ``emails`` on behalf of ``user_id``.
+
+    Addresses are validated and deduplicated (case-insensitively, and
+    against invitations that are still pending), then all ``FeedbackGiver``
+    and placeholder ``Feedback`` rows and the invitation emails for the
+    outbox are written in a single transaction.
+
+    Returns a list of :class:`InviteResult`, one per submitted address.
+    """
+    results = {}
+    order = []
+    accepted = {}
+    for raw in emails:
+        email = raw.strip()
+        key = email.lower()
+        order.append((email, key))
+        if not EMAIL_RE.match(email):
+            results.setdefault(key, InviteResult(email, 'invalid', 'Not a valid email address.'))
+        elif key in accepted:
+            continue
+        else:
+            accepted[key] = email
+
+    if accepted:
+        pending = db.session.scalars(
+            select(func.lower(FeedbackGiver.email)).where(
+                FeedbackGiver.user_id == user_id,
+                FeedbackGiver.completed.isnot(True),
+                func.lower(FeedbackGiver.email).in_(list(accepted))
+            )
+        ).all()
+        for key in pending:
+            email = accepted.pop(key)
+            results[key] = InviteResult(email, 'already_invited', 'An invitation is already pending.')
+
+    if accepted:
+        # The token column keeps a random value for uniqueness; the emailed
+        # links carry a signed token instead, see generate_invite_token(),
+        # unless SECRET_KEY is still the public default
+        givers = [{'user_id': user_id, 'email': email, 'token': str(uuid.uuid4())}
+                  for email in accepted.values()]
+        try:
+            giver_ids = db.session.scalars(
+                insert(FeedbackGiver).returning(FeedbackGiver.id, sort_by_parameter_order=True),
+                givers
+            ).all()
+            db.session.execute(
+                insert(Feedback),
+                [{'user_id': user_id, 'giver_id': giver_id, 'content': ''} for giver_id in giver_ids]
+            )
+            signed = signed_invites_enabled()
+            db.session.execute(insert(OutboxMessage), [
+                outbox_row('Your Feedback Invitation', [giver['email']], invitation_body(url_for(
+                    'feedback.feedback_page', _external=True,
+                    token=generate_invite_token(giver_id, user_id) if signed else giver['token'])))
+                for giver, giver_id in zip(givers, giver_ids)
+            ])
+            record_invites(user_id, len(giver_ids))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for key, email in accepted.items():
+                results[key] = InviteResult(email, 'failed', str(e))
+        else:
+            for key, email in accepted.items():
+                results[key] = InviteResult(email, 'invited', 'Invitation queued.')
+
+    report = []
+    reported = set()
+    for email, key in order:
+        if key in reported:
+            report.append(InviteResult(email, 'duplicate', 'Listed more than once.'))
+        else:
+            reported.add(key)
+            report.append(results[key])
+    return report
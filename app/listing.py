@@ -0,0 +1,50 @@
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import defer, joinedload, with_expression
+from .models import db, Feedback, FeedbackGiver
+
+MAX_PAGE_SIZE = 100
+
+FeedbackPage = namedtuple('FeedbackPage', ['items', 'next_before'])
+
+
+def list_feedback(user_id, before=None, limit=None):
+    """Return one page of ``user_id``'s feedback, newest first.
+
+    Pages are keyed on ``Feedback.id`` (pass the previous page's
+    ``next_before``), so the cost of a page does not depend on how deep it
+    is. The giver's email is loaded in the same query and the full
+    ``content`` is deferred in favour of a short ``preview``.
+    """
+    config = current_app.config
+    limit = max(1, min(limit or config['FEEDBACK_PAGE_SIZE'], MAX_PAGE_SIZE))
+
+    query = (
+        select(Feedback)
+        .options(
+            defer(Feedback.content),
+            with_expression(Feedback.preview, func.substr(Feedback.content, 1, config['FEEDBACK_PREVIEW_CHARS'])),
+            with_expression(Feedback.content_length, func.length(Feedback.content)),
+            joinedload(Feedback.giver).load_only(FeedbackGiver.email),
+        )
+        .where(Feedback.user_id == user_id)
+        .order_by(Feedback.id.desc())
+        .limit(limit + 1)
+    )
+    if before is not None:
+        query = query.where(Feedback.id < before)
+
+    items = db.session.scalars(query).all()
+    next_before = items[limit - 1].id if len(items) > limit else None
+    return FeedbackPage(items[:limit], next_before)
+
+
+def feedback_to_dict(feedback):
+    return {
+        'id': feedback.id,
+        'giver_email': feedback.giver.email,
+        'preview': feedback.preview,
+        'length': feedback.content_length,
+        'truncated': feedback.content_length > len(feedback.preview),
+    }
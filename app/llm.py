@@ -0,0 +1,492 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import namedtuple
+from flask import current_app
+from .backends import load_backend
+
+
+class LLMError(Exception):
+    """The language model could not produce a reply."""
+
+
+class LLMTimeout(LLMError):
+    """The call ran past its deadline."""
+
+
+class LLMUnavailable(LLMError):
+    """The call was refused without reaching the provider (busy or circuit open)."""
+
+
+# Backends yield the assistant reply as a sequence of text chunks so callers
+# can either join them (blocking) or forward them to the browser (streaming).
+# A backend that gets token counts from the provider ends the sequence with
+# a Usage, which LLMClient records on the call instead of passing it on.
+Usage = namedtuple('Usage', ['prompt_tokens', 'completion_tokens'])
+
+
+class LLMBackend:
+    """Interface for chat completion providers.
+
+    ``stream`` is used by the threaded (WSGI) views and ``astream`` by the
+    async chat endpoint. Backends without a native async implementation
+    get one that pulls chunks from ``stream`` in a worker thread.
+    """
+
+    def stream(self, messages, model, temperature, timeout):
+        raise NotImplementedError
+
+    async def astream(self, messages, model, temperature, timeout):
+        chunks = iter(self.stream(messages, model, temperature, timeout))
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
+    def warm(self):
+        """Do expensive one-off setup now instead of on the first call."""
+
+    def is_retryable(self, error):
+        return isinstance(error, (LLMTimeout, ConnectionError, TimeoutError))
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions over a single, reused HTTP client."""
+
+    def __init__(self, api_key=None, base_url=None, max_connections=16):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            api_key=config.get('OPENAI_API_KEY'),
+            base_url=config.get('OPENAI_BASE_URL'),
+            max_connections=config['LLM_MAX_CONCURRENCY'],
+        )
+
+    @property
+    def client(self):
+        # One client per process keeps TLS connections to the API alive
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # The SDK takes most of a second to import, so only
+                    # processes that actually call the API pay for it
+                    import httpx
+                    import openai
+                    limits = httpx.Limits(max_connections=self.max_connections,
+                                          max_keepalive_connections=self.max_connections)
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=0,  # retries are handled by LLMClient
+                        http_client=httpx.Client(limits=limits),
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    import openai
+                    limits = httpx.Limits(max_connections=self.max_connections,
+                                          max_keepalive_connections=self.max_connections)
+                    self._async_client = openai.AsyncOpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=0,
+                        http_client=httpx.AsyncClient(limits=limits),
+                    )
+        return self._async_client
+
+    def stream(self, messages, model, temperature, timeout):
+        stream = self.client.with_options(timeout=timeout).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={'include_usage': True},
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                yield Usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    async def astream(self, messages, model, temperature, timeout):
+        stream = await self.async_client.with_options(timeout=timeout).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={'include_usage': True},
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                yield Usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def warm(self):
+        # Only pay the SDK import up front; building the client needs an API
+        # key, which commands that never call the model do not have
+        import httpx  # noqa: F401
+        import openai  # noqa: F401
+
+    def is_retryable(self, error):
+        import openai
+        return isinstance(error, (openai.APIConnectionError, openai.RateLimitError,
+                                  openai.InternalServerError)) or super().is_retryable(error)
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic local stand-in for the OpenAI API.
+
+    Replies echo the last user message after ``first_token_delay`` seconds
+    and then emit one word every ``token_delay`` seconds. ``failure_rate``
+    makes a seeded fraction of calls fail before the first token, to
+    exercise retries and the circuit breaker.
+    """
+
+    def __init__(self, first_token_delay=0.5, token_delay=0.02, reply='{message}',
+                 failure_rate=0.0, seed=0):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.reply = reply
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            first_token_delay=config['FAKE_LLM_FIRST_TOKEN_DELAY'],
+            token_delay=config['FAKE_LLM_TOKEN_DELAY'],
+            reply=config['FAKE_LLM_REPLY'],
+            failure_rate=config['FAKE_LLM_FAILURE_RATE'],
+            seed=config['FAKE_LLM_SEED'],
+        )
+
+    def _plan(self, messages):
+        last_user = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        words = self.reply.format(message=last_user[:80]).split(' ')
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+        return [words[0]] + [' ' + word for word in words[1:]], fail
+
+    def stream(self, messages, model, temperature, timeout):
+        chunks, fail = self._plan(messages)
+        if self.first_token_delay > timeout:
+            time.sleep(timeout)
+            raise LLMTimeout(f'No response within {timeout:.1f}s')
+        time.sleep(self.first_token_delay)
+        if fail:
+            raise ConnectionError('Simulated upstream failure')
+
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self.token_delay)
+            yield chunk
+
+    async def astream(self, messages, model, temperature, timeout):
+        chunks, fail = self._plan(messages)
+        if self.first_token_delay > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeout(f'No response within {timeout:.1f}s')
+        await asyncio.sleep(self.first_token_delay)
+        if fail:
+            raise ConnectionError('Simulated upstream failure')
+
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield chunk
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider for ``reset_timeout`` seconds.
+
+    After ``threshold`` consecutive failures the breaker opens and calls
+    are refused immediately; once the timeout has passed a single trial
+    call is let through and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class LLMCall:
+    """Bookkeeping for one client call, handed to the client's ``observer``.
+
+    The observer is called once the call ends with an outcome of ``ok``,
+    ``cancelled`` (the caller stopped reading), ``rejected`` (busy or circuit
+    open), ``timeout`` or ``error``.
+    """
+
+    def __init__(self, client, messages):
+        self.client = client
+        self.messages = messages
+        self.started = time.monotonic()
+        self.first_chunk_at = None
+        self.chunks = []
+        self.usage = None  # Usage reported by the provider, if any
+
+    def chunk(self, text):
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.monotonic()
+        self.chunks.append(text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observer = self.client.observer
+        if observer is None:
+            return False
+        if exc_type is None:
+            outcome = 'ok'
+        elif issubclass(exc_type, GeneratorExit):
+            outcome = 'cancelled'
+        elif issubclass(exc_type, LLMUnavailable):
+            outcome = 'rejected'
+        elif issubclass(exc_type, LLMTimeout):
+            outcome = 'timeout'
+        else:
+            outcome = 'error'
+        observer(outcome, self)
+        return False
+
+
+class LLMClient:
+    """Wraps a backend with deadlines, retries, bounded concurrency and a circuit breaker.
+
+    At most ``max_concurrency`` threaded calls are in flight per process
+    (``max_async_concurrency`` for the async endpoint, where a waiting call
+    does not hold a thread); further callers wait up to ``queue_timeout``
+    seconds for a slot. A call is retried with jittered exponential backoff
+    only if it failed before the first chunk was produced, and never past
+    its ``timeout`` deadline. ``observer``, if set, is called with the
+    outcome and the :class:`LLMCall` when each call ends.
+    """
+
+    def __init__(self, backend, model, timeout=60.0, max_retries=2, retry_base_delay=0.5,
+                 retry_max_delay=8.0, max_concurrency=16, max_async_concurrency=256,
+                 queue_timeout=5.0, breaker=None, observer=None):
+        self.backend = backend
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_async_concurrency = max_async_concurrency
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.observer = observer
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+    def _retry_delay(self, error, attempt, started, deadline):
+        # Seconds to wait before the next attempt, or None to give up
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        if (started or attempt >= self.max_retries or not self.backend.is_retryable(error)
+                or time.monotonic() + delay >= deadline):
+            return None
+        return delay
+
+    def _record_error(self, error):
+        # Only errors worth retrying say the provider is unhealthy; one that
+        # rejects the request itself (bad input, context too long) still
+        # shows the provider is up and must not open the breaker
+        if self.backend.is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stream(self, messages, temperature=0.7):
+        with LLMCall(self, messages) as call:
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                raise LLMUnavailable('Too many conversations are in progress.')
+            try:
+                deadline = time.monotonic() + self.timeout
+                attempt = 0
+                while True:
+                    if not self.breaker.allow():
+                        raise LLMUnavailable('The language model is temporarily unavailable.')
+                    started = False
+                    try:
+                        remaining = deadline - time.monotonic()
+                        for chunk in self.backend.stream(messages, self.model, temperature, remaining):
+                            if isinstance(chunk, Usage):
+                                call.usage = chunk
+                                continue
+                            started = True
+                            if time.monotonic() > deadline:
+                                raise LLMTimeout(f'No complete response within {self.timeout:.0f}s')
+                            call.chunk(chunk)
+                            yield chunk
+                    except GeneratorExit:
+                        # The caller stopped reading (e.g. the browser went away)
+                        # after the provider had already answered
+                        self.breaker.record_success()
+                        raise
+                    except Exception as e:
+                        self._record_error(e)
+                        delay = self._retry_delay(e, attempt, started, deadline)
+                        if delay is None:
+                            if isinstance(e, LLMError):
+                                raise
+                            raise LLMError(str(e)) from e
+                        attempt += 1
+                        time.sleep(delay)
+                        continue
+                    self.breaker.record_success()
+                    return
+            finally:
+                self._slots.release()
+
+    def complete(self, messages, temperature=0.7):
+        return ''.join(self.stream(messages, temperature=temperature))
+
+    def _async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_slots.get(loop)
+        if semaphore is None:
+            semaphore = self._async_slots[loop] = asyncio.Semaphore(self.max_async_concurrency)
+        return semaphore
+
+    async def astream(self, messages, temperature=0.7):
+        """Async counterpart of :meth:`stream` for the ASGI chat endpoint."""
+        with LLMCall(self, messages) as call:
+            semaphore = self._async_semaphore()
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise LLMUnavailable('Too many conversations are in progress.') from None
+            try:
+                deadline = time.monotonic() + self.timeout
+                attempt = 0
+                while True:
+                    if not self.breaker.allow():
+                        raise LLMUnavailable('The language model is temporarily unavailable.')
+                    started = False
+                    try:
+                        remaining = deadline - time.monotonic()
+                        async for chunk in self.backend.astream(messages, self.model, temperature, remaining):
+                            if isinstance(chunk, Usage):
+                                call.usage = chunk
+                                continue
+                            started = True
+                            if time.monotonic() > deadline:
+                                raise LLMTimeout(f'No complete response within {self.timeout:.0f}s')
+                            call.chunk(chunk)
+                            yield chunk
+                    except GeneratorExit:
+                        self.breaker.record_success()
+                        raise
+                    except Exception as e:
+                        self._record_error(e)
+                        delay = self._retry_delay(e, attempt, started, deadline)
+                        if delay is None:
+                            if isinstance(e, LLMError):
+                                raise
+                            raise LLMError(str(e)) from e
+                        attempt += 1
+                        await asyncio.sleep(delay)
+                        continue
+                    self.breaker.record_success()
+                    return
+            finally:
+                semaphore.release()
+
+
+# Built-in backends for LLM_BACKEND, see load_backend()
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'fake': FakeBackend,
+}
+
+
+def init_llm(app):
+    config = app.config
+    backend = load_backend(config['LLM_BACKEND'], BACKENDS).from_config(config)
+    app.extensions['llm'] = LLMClient(
+        backend,
+        model=config['LLM_MODEL'],
+        timeout=config['LLM_TIMEOUT'],
+        max_retries=config['LLM_MAX_RETRIES'],
+        retry_base_delay=config['LLM_RETRY_BASE_DELAY'],
+        retry_max_delay=config['LLM_RETRY_MAX_DELAY'],
+        max_concurrency=config['LLM_MAX_CONCURRENCY'],
+        max_async_concurrency=config['LLM_ASYNC_MAX_CONCURRENCY'],
+        queue_timeout=config['LLM_QUEUE_TIMEOUT'],
+        breaker=CircuitBreaker(config['LLM_BREAKER_THRESHOLD'], config['LLM_BREAKER_RESET']),
+    )
+    if config['STARTUP_MODE'] == 'eager':
+        backend.warm()
+
+
+def get_llm():
+    return current_app.extensions['llm']
+
+
+def stream_chat(messages, temperature=0.7):
+    """Yield the assistant reply for ``messages`` chunk by chunk."""
+    return get_llm().stream(messages, temperature=temperature)
+
+
+def complete_chat(messages, temperature=0.7):
+    """Return the full assistant reply for ``messages``."""
+    return get_llm().complete(messages, temperature=temperature)
@@ -0,0 +1,190 @@
+import random
+import smtplib
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from email.utils import formataddr
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_mail import Message
+from sqlalchemy import and_, or_, select, update
+from .metrics import MAIL_CONNECT_LATENCY, MAIL_MESSAGES, MAIL_SEND_LATENCY
+from .models import db, OutboxMessage
+
+
+def outbox_row(subject, recipients, body, sender=None):
+    """Column values for an ``OutboxMessage``, for use with bulk inserts."""
+    if isinstance(sender, tuple):
+        sender = formataddr(sender)
+    return {
+        'subject': subject,
+        'recipients': ','.join(recipients),
+        'body': body,
+        'sender': sender,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.now(timezone.utc),
+    }
+
+
+def enqueue_mail(subject, recipients, body, sender=None):
+    """Add a message to the outbox. It is sent once the caller commits."""
+    message = OutboxMessage(**outbox_row(subject, recipients, body, sender))
+    db.session.add(message)
+    return message
+
+
+def _build_message(row):
+    return Message(row.subject, recipients=row.recipients.split(','), body=row.body,
+                   sender=row.sender or None)
+
+
+class MailWorker:
+    """Drains the outbox over a single reused SMTP connection.
+
+    Messages are claimed in batches so several workers can share one
+    outbox, sent at no more than ``MAIL_RATE_LIMIT`` per second, retried
+    with exponential backoff and moved to the ``dead`` state after
+    ``MAIL_MAX_ATTEMPTS`` failures.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._stopping = threading.Event()
+        self._thread = None
+        self._next_send_at = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='mail-worker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        interval = self.app.config['MAIL_WORKER_POLL_INTERVAL']
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception:
+                self.app.logger.exception('Mail worker failed to drain the outbox')
+            self._stopping.wait(interval)
+
+    def drain(self):
+        """Send due messages until none are left. Returns the number processed."""
+        mail = current_app.extensions['mail']
+        processed = 0
+        with ExitStack() as stack:
+            connection = None
+            while not self._stopping.is_set():
+                batch = self._claim_batch()
+                if not batch:
+                    break
+                if connection is None:
+                    started = time.perf_counter()
+                    try:
+                        connection = stack.enter_context(mail.connect())
+                        MAIL_CONNECT_LATENCY.observe(time.perf_counter() - started)
+                    except Exception as e:
+                        self._finish(batch, {row.id: e for row in batch})
+                        processed += len(batch)
+                        break
+                errors = {}
+                for row in batch:
+                    self._throttle()
+                    started = time.perf_counter()
+                    try:
+                        self._send(connection, row)
+                    except Exception as e:
+                        errors[row.id] = e
+                    MAIL_SEND_LATENCY.observe(time.perf_counter() - started,
+                                              outcome='error' if row.id in errors else 'ok')
+                self._finish(batch, errors)
+                processed += len(batch)
+        return processed
+
+    def _send(self, connection, row):
+        message = _build_message(row)
+        try:
+            connection.send(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the idle connection; reconnect once
+            connection.host = connection.configure_host()
+            connection.send(message)
+
+    def _throttle(self):
+        rate = current_app.config['MAIL_RATE_LIMIT']
+        if rate <= 0:
+            return
+        now = time.monotonic()
+        if self._next_send_at > now:
+            time.sleep(self._next_send_at - now)
+            now = self._next_send_at
+        self._next_send_at = now + 1.0 / rate
+
+    def _claim_batch(self):
+        config = current_app.config
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=config['MAIL_CLAIM_TIMEOUT'])
+        due = select(OutboxMessage.id).where(or_(
+            and_(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now),
+            # Claimed by a worker that never finished
+            and_(OutboxMessage.status == 'sending', OutboxMessage.claimed_at < stale),
+        )).order_by(OutboxMessage.id).limit(config['MAIL_BATCH_SIZE'])
+        rows = db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(due.scalar_subquery()))
+            .values(status='sending', claimed_at=now)
+            .returning(OutboxMessage.id, OutboxMessage.subject, OutboxMessage.sender,
+                       OutboxMessage.recipients, OutboxMessage.body, OutboxMessage.attempts)
+        ).all()
+        db.session.commit()
+        return sorted(rows, key=lambda row: row.id)
+
+    def _finish(self, batch, errors):
+        config = current_app.config
+        now = datetime.now(timezone.utc)
+        changes = []
+        for row in batch:
+            error = errors.get(row.id)
+            attempts = row.attempts + 1
+            if error is None:
+                changes.append({'id': row.id, 'status': 'sent', 'attempts': attempts, 'claimed_at': None,
+                                'last_error': None, 'sent_at': now})
+                continue
+            if attempts >= config['MAIL_MAX_ATTEMPTS']:
+                status, retry_at = 'dead', now
+            else:
+                delay = min(config['MAIL_RETRY_BASE_DELAY'] * 2 ** (attempts - 1), config['MAIL_RETRY_MAX_DELAY'])
+                status, retry_at = 'pending', now + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+            changes.append({'id': row.id, 'status': status, 'attempts': attempts, 'claimed_at': None,
+                            'last_error': str(error), 'next_attempt_at': retry_at})
+        # Bulk UPDATE by primary key
+        db.session.execute(update(OutboxMessage), changes)
+        db.session.commit()
+        for change in changes:
+            MAIL_MESSAGES.inc(status=change['status'])
+
+
+def start_mail_worker(app):
+    worker = MailWorker(app).start()
+    app.extensions['mail_worker'] = worker
+    return worker
+
+
+@click.command('mail-worker')
+@click.option('--once', is_flag=True, help='Drain the outbox once and exit.')
+@with_appcontext
+def mail_worker_command(once):
+    """Send queued mail from the outbox."""
+    worker = MailWorker(current_app._get_current_object())
+    if once:
+        click.echo(f'Processed {worker.drain()} messages.')
+    else:
+        worker.run()
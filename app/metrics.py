@@ -0,0 +1,339 @@
+import hmac
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from .identity import identity_cache
+from .models import db
+from .prompting import MESSAGE_OVERHEAD, count_tokens
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # label values -> state
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_number(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self, items):
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, key, [le])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total)}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {count}'
+
+
+class Sampled(Metric):
+    """A single value read from ``fn`` at scrape time, for state kept elsewhere."""
+
+    def __init__(self, name, documentation, kind, fn):
+        super().__init__(name, documentation)
+        self.kind = kind
+        self.fn = fn
+
+    def _render_samples(self, items):
+        yield f'{self.name} {_format_number(self.fn())}'
+
+
+class Registry:
+    """Process-wide set of metrics rendered in the Prometheus text format.
+
+    Values live in this process only; with several workers, scrape each one
+    (or run a single worker per container) and aggregate in Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def sampled(self, name, documentation, kind, fn):
+        return self._register(Sampled(name, documentation, kind, fn))
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint and status.', ('method', 'endpoint', 'status'))
+HTTP_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Time from receiving a request until its response is closed.',
+    ('method', 'endpoint'))
+HTTP_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Database queries issued per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+DB_QUERIES = registry.counter('db_queries_total', 'SQL statements executed.')
+DB_LATENCY = registry.histogram('db_query_duration_seconds', 'SQL statement execution time.')
+DB_SLOW_QUERIES = registry.counter('db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_THRESHOLD.')
+LLM_CALLS = registry.counter('llm_calls_total', 'Language model calls by outcome.', ('outcome',))
+LLM_LATENCY = registry.histogram(
+    'llm_call_duration_seconds', 'Language model call time, including queueing and retries.', ('outcome',))
+LLM_FIRST_CHUNK = registry.histogram(
+    'llm_time_to_first_chunk_seconds', 'Time until the language model produced the first chunk.')
+LLM_PROMPT_TOKENS = registry.counter('llm_prompt_tokens_total', 'Prompt tokens sent to the language model.')
+LLM_COMPLETION_TOKENS = registry.counter(
+    'llm_completion_tokens_total', 'Completion tokens received from the language model.')
+RATE_LIMITED = registry.counter('rate_limited_requests_total', 'Chat turns refused with 429 by the bucket that ran out.',
+                                ('scope',))
+ADMISSION_REJECTED = registry.counter(
+    'admission_rejected_requests_total', 'Chat turns refused with 503 because too many were in flight.')
+CHAT_TURNS_IN_FLIGHT = registry.gauge('chat_turns_in_flight', 'Admitted chat turns waiting on or running an LLM call.')
+registry.sampled('identity_cache_hits_total', 'current_user loads served from the identity cache.', 'counter',
+                 lambda: identity_cache.stats()['hits'])
+registry.sampled('identity_cache_misses_total', 'current_user loads that read the user row.', 'counter',
+                 lambda: identity_cache.stats()['misses'])
+registry.sampled('identity_cache_invalidations_total', 'Identity cache entries dropped after a profile change.',
+                 'counter', lambda: identity_cache.stats()['invalidations'])
+registry.sampled('identity_cache_entries', 'Users currently in the identity cache.', 'gauge',
+                 lambda: identity_cache.stats()['size'])
+MAIL_CONNECT_LATENCY = registry.histogram('mail_connect_duration_seconds', 'Time to open an SMTP connection.')
+MAIL_SEND_LATENCY = registry.histogram('mail_send_duration_seconds', 'Time to send one message.', ('outcome',))
+MAIL_MESSAGES = registry.counter('mail_messages_total', 'Outbox messages processed by resulting status.',
+                                 ('status',))
+
+
+def observe_llm_call(outcome, call):
+    """``LLMClient`` observer recording latency and token usage."""
+    LLM_CALLS.inc(outcome=outcome)
+    LLM_LATENCY.observe(time.monotonic() - call.started, outcome=outcome)
+    if call.first_chunk_at is not None:
+        LLM_FIRST_CHUNK.observe(call.first_chunk_at - call.started)
+    if call.usage is not None:
+        LLM_PROMPT_TOKENS.inc(call.usage.prompt_tokens)
+        LLM_COMPLETION_TOKENS.inc(call.usage.completion_tokens)
+    elif outcome in ('ok', 'cancelled'):
+        # Backends that report no usage (the fake one, or a stream cut short
+        # before the provider's final chunk) get a local estimate
+        LLM_PROMPT_TOKENS.inc(sum(count_tokens(message['content']) + MESSAGE_OVERHEAD
+                                  for message in call.messages))
+        LLM_COMPLETION_TOKENS.inc(count_tokens(''.join(call.chunks)))
+
+
+class StackSampler:
+    """Samples the call stacks of threads that are serving a request.
+
+    A single background thread wakes every ``interval`` seconds and records
+    the current stack of each registered thread, so a slow request can be
+    reported as a collapsed-stack profile (one ``frame;frame;frame count``
+    line per distinct stack, ready for flamegraph tools).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._active = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = StackCounter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        return ident
+
+    def end(self, ident):
+        with self._lock:
+            return self._active.pop(ident, StackCounter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _after_request(response):
+    app = current_app._get_current_object()
+    method = request.method
+    endpoint = request.endpoint or 'unmatched'
+    started = g._request_started
+    queries = g._request_queries
+    sampler = app.extensions.get('stack_sampler')
+    sample_ident = g.get('_sample_ident')
+
+    # Streamed responses keep running after the view returns, so the
+    # request is measured when the server closes the response
+    def finish():
+        elapsed = time.perf_counter() - started
+        HTTP_REQUESTS.inc(method=method, endpoint=endpoint, status=response.status_code)
+        HTTP_LATENCY.observe(elapsed, method=method, endpoint=endpoint)
+        HTTP_QUERIES.observe(queries[0], endpoint=endpoint)
+        if sampler is not None:
+            samples = sampler.end(sample_ident)
+            if elapsed >= app.config['PROFILE_SLOW_REQUEST_THRESHOLD'] and samples:
+                top = '\n'.join(f'{stack} {count}' for stack, count in
+                                samples.most_common(app.config['PROFILE_MAX_STACKS']))
+                app.logger.warning('Slow request %s %s took %.3fs (%d queries); sampled stacks:\n%s',
+                                   method, endpoint, elapsed, queries[0], top)
+
+    response.call_on_close(finish)
+    return response
+
+
+def _before_request():
+    g._request_started = time.perf_counter()
+    g._request_queries = [0]
+    sampler = current_app.extensions.get('stack_sampler')
+    if sampler is not None:
+        g._sample_ident = sampler.begin()
+
+
+def _instrument_engine(app, engine):
+    threshold = app.config['SLOW_QUERY_THRESHOLD']
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        DB_QUERIES.inc()
+        DB_LATENCY.observe(elapsed)
+        if has_request_context() and '_request_queries' in g:
+            g._request_queries[0] += 1
+        if elapsed >= threshold:
+            DB_SLOW_QUERIES.inc()
+            app.logger.warning('Slow query (%.3fs): %s', elapsed, ' '.join(statement.split()))
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    # Constant-time, so the token cannot be guessed from response timings
+    if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                         f'Bearer {token}'.encode()):
+        abort(401)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """Instrument requests, SQL, LLM calls and mail, and serve ``METRICS_PATH``."""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    with app.app_context():
+        _instrument_engine(app, db.engine)
+    if 'llm' in app.extensions:
+        app.extensions['llm'].observer = observe_llm_call
+    if app.config.get('PROFILE_SLOW_REQUESTS'):
+        app.extensions['stack_sampler'] = StackSampler(app.config['PROFILE_SAMPLE_INTERVAL'])
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule(app.config['METRICS_PATH'], 'metrics', metrics_view)
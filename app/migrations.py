@@ -0,0 +1,197 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from .models import db, FeedbackRollup, FeedbackStats, RateLimitBucket
+
+# Ordered list of (version, description, function). Each function receives
+# the connection holding the migration lock, inside the transaction that
+# applies every pending migration, and must be safe to run against a
+# database that was created with db.create_all() before migrations existed.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return fn
+    return register
+
+
+@migration(1, 'Create base schema')
+def _create_base_schema(connection):
+    db.metadata.create_all(connection)
+
+
+@migration(2, 'Index hot lookup columns')
+def _index_lookup_columns(connection):
+    for name, table, column in [
+        ('ix_user_email', 'user', 'email'),
+        ('ix_feedback_user_id', 'feedback', 'user_id'),
+        ('ix_feedback_giver_id', 'feedback', 'giver_id'),
+        ('ix_feedback_giver_user_id', 'feedback_giver', 'user_id'),
+    ]:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({column})'))
+
+
+def _add_column(connection, table, column, ddl):
+    # Tables created by a later db.create_all() already have the column
+    if column not in {col['name'] for col in inspect(connection).get_columns(table)}:
+        connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+@migration(3, 'Record when an invitation was completed')
+def _add_feedback_giver_completed_at(connection):
+    _add_column(connection, 'feedback_giver', 'completed_at', 'DATETIME')
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_feedback_giver_completed_at ON feedback_giver (completed_at)'
+    ))
+
+
+@migration(4, 'Full-text index over feedback content')
+def _create_feedback_fts(connection):
+    if connection.dialect.name != 'sqlite':
+        return  # search falls back to LIKE, see app/search.py
+    # External-content FTS5 table: it stores only the index and reads the
+    # text back through the view. The owner column holds a 'u<user_id>'
+    # token so a search only ranks the searching user's rows; the triggers
+    # keep the index in step with every write to feedback
+    connection.execute(text(
+        "CREATE VIEW IF NOT EXISTS feedback_fts_source AS "
+        "SELECT id, content, 'u' || user_id AS owner FROM feedback"
+    ))
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS feedback_fts USING fts5("
+        "content, owner, content='feedback_fts_source', content_rowid='id')"
+    ))
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS feedback_fts_insert AFTER INSERT ON feedback BEGIN '
+        "INSERT INTO feedback_fts (rowid, content, owner) VALUES (new.id, new.content, 'u' || new.user_id); END"
+    ))
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS feedback_fts_delete AFTER DELETE ON feedback BEGIN '
+        "INSERT INTO feedback_fts (feedback_fts, rowid, content, owner) "
+        "VALUES ('delete', old.id, old.content, 'u' || old.user_id); END"
+    ))
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS feedback_fts_update AFTER UPDATE OF content, user_id ON feedback BEGIN '
+        "INSERT INTO feedback_fts (feedback_fts, rowid, content, owner) "
+        "VALUES ('delete', old.id, old.content, 'u' || old.user_id); "
+        "INSERT INTO feedback_fts (rowid, content, owner) VALUES (new.id, new.content, 'u' || new.user_id); END"
+    ))
+    # Rank by BM25 over the content column only
+    connection.execute(text("INSERT INTO feedback_fts (feedback_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"))
+    connection.execute(text("INSERT INTO feedback_fts (feedback_fts) VALUES ('rebuild')"))
+
+
+@migration(5, 'Per-user feedback aggregates and summaries')
+def _create_feedback_aggregates(connection):
+    db.metadata.create_all(connection, tables=[FeedbackStats.__table__, FeedbackRollup.__table__])
+    connection.execute(text(
+        'INSERT INTO feedback_stats (user_id, invites_sent, invites_completed, last_feedback_id, last_activity_at) '
+        'SELECT u.id, '
+        '(SELECT count(*) FROM feedback_giver g WHERE g.user_id = u.id), '
+        '(SELECT count(*) FROM feedback_giver g WHERE g.user_id = u.id AND g.completed), '
+        "(SELECT coalesce(max(f.id), 0) FROM feedback f WHERE f.user_id = u.id AND f.content != ''), "
+        '(SELECT max(g.completed_at) FROM feedback_giver g WHERE g.user_id = u.id) '
+        'FROM "user" u WHERE u.id NOT IN (SELECT user_id FROM feedback_stats)'
+    ))
+
+
+@migration(6, 'Shared rate limit buckets')
+def _create_rate_limit_buckets(connection):
+    db.metadata.create_all(connection, tables=[RateLimitBucket.__table__])
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at DATETIME NOT NULL)'
+    ))
+
+
+def _applied_versions(connection):
+    _ensure_version_table(connection)
+    return {row[0] for row in connection.execute(text('SELECT version FROM schema_version'))}
+
+
+def applied_versions():
+    with db.engine.begin() as connection:
+        return _applied_versions(connection)
+
+
+@contextmanager
+def _migration_lock(lock_timeout):
+    """A connection holding the database's write lock, committed on success.
+
+    pysqlite would otherwise commit before every DDL statement, so on SQLite
+    the connection runs in autocommit mode and the transaction is opened by
+    hand with ``BEGIN EXCLUSIVE``: DDL then rolls back with the rest, and
+    other processes wait (up to ``lock_timeout`` seconds, however long the
+    migrations take) instead of applying the same migrations at once.
+    """
+    with db.engine.connect() as connection:
+        if connection.dialect.name != 'sqlite':
+            with connection.begin():
+                if connection.dialect.name == 'postgresql':
+                    _ensure_version_table(connection)
+                    connection.execute(text('LOCK TABLE schema_version IN EXCLUSIVE MODE'))
+                yield connection
+            return
+
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            try:
+                connection.exec_driver_sql('BEGIN EXCLUSIVE')
+                break
+            except OperationalError as e:
+                if 'locked' not in str(e) or time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+        try:
+            yield connection
+        except BaseException:
+            connection.exec_driver_sql('ROLLBACK')
+            raise
+        connection.exec_driver_sql('COMMIT')
+
+
+def upgrade_database(lock_timeout=300):
+    """Apply pending migrations in order. Returns the list of versions applied.
+
+    Safe to call from several processes at once: the pending versions are
+    read and applied under one exclusive lock, so each migration runs once
+    and a failure leaves the database as it was.
+    """
+    newly_applied = []
+    with _migration_lock(lock_timeout) as connection:
+        applied = _applied_versions(connection)
+        for version, description, fn in MIGRATIONS:
+            if version in applied:
+                continue
+            fn(connection)
+            connection.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.now(timezone.utc)}
+            )
+            newly_applied.append((version, description))
+    for version, description in newly_applied:
+        current_app.logger.info('Applied migration %s: %s', version, description)
+    return [version for version, _ in newly_applied]
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending database migrations."""
+    applied = upgrade_database()
+    if applied:
+        click.echo(f'Applied migrations: {", ".join(map(str, applied))}')
+    else:
+        click.echo('Database is up to date.')
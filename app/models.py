@@ -1,12 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from datetime import datetime, timezone
 
 db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
-    email = db.Column(db.String(150), nullable=False)
+    email = db.Column(db.String(150), nullable=False, index=True)
     feedbacks = db.relationship('Feedback', backref='user', lazy=True)
     password = db.Column(db.String(150), nullable=False)
     first_name = db.Column(db.String(150), nullable=False)
@@ -16,14 +17,77 @@ class User(UserMixin, db.Model):
 
 class Feedback(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    giver_id = db.Column(db.Integer, db.ForeignKey('feedback_giver.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    giver_id = db.Column(db.Integer, db.ForeignKey('feedback_giver.id'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
+    # Populated by listing queries that defer the full content
+    preview = db.query_expression()
+    content_length = db.query_expression()
 
 class FeedbackGiver(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     email = db.Column(db.String(150), unique=False, nullable=False)
     token = db.Column(db.String(100), unique=True, nullable=False)
     completed = db.Column(db.Boolean, default=False)
+    completed_at = db.Column(db.DateTime, nullable=True, index=True)
     feedback = db.relationship('Feedback', backref='giver', lazy=True)
+
+class ConversationTurn(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    giver_id = db.Column(db.Integer, db.ForeignKey('feedback_giver.id'), nullable=False, index=True)
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class ConversationSummary(db.Model):
+    giver_id = db.Column(db.Integer, db.ForeignKey('feedback_giver.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    covered_turns = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+
+class OutboxMessage(db.Model):
+    __table_args__ = (db.Index('ix_outbox_message_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255), nullable=True)
+    recipients = db.Column(db.Text, nullable=False)  # comma separated
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class FeedbackStats(db.Model):
+    # Per-user counters kept up to date by app/aggregates.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    invites_sent = db.Column(db.Integer, nullable=False, default=0)
+    invites_completed = db.Column(db.Integer, nullable=False, default=0)
+    last_feedback_id = db.Column(db.Integer, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    user = db.relationship('User')
+
+    @property
+    def invites_pending(self):
+        return self.invites_sent - self.invites_completed
+
+class FeedbackRollup(db.Model):
+    # LLM summary across all of a user's feedback, see app/aggregates.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    content_hash = db.Column(db.String(64), nullable=False, default='')
+    covered_feedback_id = db.Column(db.Integer, nullable=False, default=0)
+    generated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                             onupdate=lambda: datetime.now(timezone.utc))
+
+
+class RateLimitBucket(db.Model):
+    # Token buckets shared by all workers when RATE_LIMIT_BACKEND is 'database'
+    key = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)  # seconds since the epoch
@@ -0,0 +1,139 @@
+from collections import namedtuple
+from flask import current_app, g
+from .models import db, ConversationSummary
+from .llm import complete_chat
+
+SYSTEM_PROMPT = "You are an AI designed to help colleagues provide feedback on Foreign Service Officers (FSOs) in a relaxed, conversational style—like friends chatting over coffee or a beer. Your goal is to guide them through a story-driven feedback process, asking open-ended questions about leadership, communication, and handling challenges.Start by asking what the person providing feedback has worked on with the FSO. Encourage them to share specific examples, then follow up with thoughtful questions to dive deeper. Occasionally paraphrase or summarize their responses to show you're actively listening and understanding. Keep the conversation friendly and engaging, and after about 10 minutes, check in to see how they’re feeling, adjusting the pace if needed. As you wrap up, casually summarize the session, highlighting strengths, areas for growth, and suggest actionable next steps, inviting them to confirm or add to the summary."
+
+SUMMARY_PROMPT = ("You maintain a running summary of a feedback conversation about a Foreign Service Officer. "
+                  "Update the existing summary with the new turns. Keep concrete examples, names, projects, "
+                  "strengths and growth areas that were mentioned, drop small talk, and answer with the "
+                  "updated summary only, in at most {max_words} words.")
+
+ROLLUP_PROMPT = ("You write an overall summary of the feedback a Foreign Service Officer has received from "
+                 "several colleagues. Update the existing overview with the new feedback conversations: the "
+                 "recurring strengths, the growth areas, and concrete examples that support them. Answer with "
+                 "the updated overview only, in at most {max_words} words.")
+
+# Tokens added by the chat format around every message
+MESSAGE_OVERHEAD = 4
+
+PromptStats = namedtuple('PromptStats', [
+    'system_tokens', 'summary_tokens', 'history_tokens', 'total_tokens',
+    'turns_sent', 'turns_summarized',
+])
+
+_encoding = None
+
+
+def _get_encoding():
+    # tiktoken is optional and slow to import, so it is loaded on first use
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+        except ImportError:  # falls back to a character-based estimate
+            _encoding = False
+        else:
+            _encoding = tiktoken.get_encoding('o200k_base')
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message):
+    return count_tokens(message['content']) + MESSAGE_OVERHEAD
+
+
+def prompt_tokens(messages):
+    """Tokens that ``messages`` take up in a chat completion prompt."""
+    return sum(_message_tokens(msg) for msg in messages)
+
+
+def _summary_message(summary):
+    return {'role': 'system', 'content': f'Summary of the conversation so far:\n{summary}'}
+
+
+def _update_summary(summary, turns):
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in turns)
+    max_words = current_app.config['LLM_SUMMARY_MAX_WORDS']
+    return complete_chat([
+        {'role': 'system', 'content': SUMMARY_PROMPT.format(max_words=max_words)},
+        {'role': 'user', 'content': f'Existing summary:\n{summary or "(none)"}\n\nNew turns:\n{transcript}'},
+    ], temperature=0.2)
+
+
+def build_prompt(giver_id, history):
+    """Assemble the messages for the next chat completion.
+
+    The system prompt and the running summary form a prefix that only
+    changes when older turns are folded into the summary, which keeps
+    provider-side prompt caching effective. Turns that are not yet covered
+    by the summary are sent verbatim until the budget is exceeded, at which
+    point everything but the latest ``LLM_RECENT_TURNS`` is summarized.
+
+    Returns ``(messages, stats)``; the stats are also stored on ``g``.
+    """
+    config = current_app.config
+    budget = config['LLM_PROMPT_TOKEN_BUDGET']
+    keep_recent = config['LLM_RECENT_TURNS']
+
+    system_message = {'role': 'system', 'content': SYSTEM_PROMPT}
+    system_tokens = _message_tokens(system_message)
+
+    record = db.session.get(ConversationSummary, giver_id)
+    summary = record.summary if record else ''
+    covered = record.covered_turns if record else 0
+    if covered > len(history):
+        # The transcript was reset underneath us
+        summary, covered = '', 0
+
+    pending = history[covered:]
+    pending_tokens = prompt_tokens(pending)
+    summary_tokens = _message_tokens(_summary_message(summary)) if summary else 0
+
+    if system_tokens + summary_tokens + pending_tokens > budget and len(pending) > keep_recent:
+        split = len(history) - keep_recent
+        try:
+            summary = _update_summary(summary, history[covered:split])
+        except Exception as e:
+            # Keep serving the chat with the recent turns only
+            current_app.logger.warning('Conversation summary update failed for giver %s: %s', giver_id, e)
+        else:
+            if record is None:
+                record = ConversationSummary(giver_id=giver_id)
+                db.session.add(record)
+            record.summary = summary
+            record.covered_turns = split
+            db.session.commit()
+        covered = split
+        pending = history[covered:]
+        pending_tokens = prompt_tokens(pending)
+        summary_tokens = _message_tokens(_summary_message(summary)) if summary else 0
+
+    # Never exceed the budget, even if the latest turns alone are too long
+    while pending and len(pending) > 1 and system_tokens + summary_tokens + pending_tokens > budget:
+        pending_tokens -= _message_tokens(pending[0])
+        pending = pending[1:]
+
+    messages = [system_message]
+    if summary:
+        messages.append(_summary_message(summary))
+    messages.extend(pending)
+
+    stats = PromptStats(
+        system_tokens=system_tokens,
+        summary_tokens=summary_tokens,
+        history_tokens=pending_tokens,
+        total_tokens=system_tokens + summary_tokens + pending_tokens,
+        turns_sent=len(pending),
+        turns_summarized=covered,
+    )
+    g.prompt_stats = stats
+    return messages, stats
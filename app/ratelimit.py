@@ -0,0 +1,193 @@
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import case, delete, insert, literal, select, update
+from .backends import load_backend
+from .metrics import ADMISSION_REJECTED, CHAT_TURNS_IN_FLIGHT, RATE_LIMITED
+from .models import db, RateLimitBucket
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# capacity is the burst size; rate is tokens added back per second
+Rule = namedtuple('Rule', ['capacity', 'rate'])
+Rejection = namedtuple('Rejection', ['status', 'message', 'retry_after'])
+
+
+def parse_rule(spec):
+    """Parse ``'<requests>/<second|minute|hour|day>'`` into a :class:`Rule`, or ``None`` if empty."""
+    if not spec:
+        return None
+    count, _, period = spec.partition('/')
+    capacity = float(count)
+    return Rule(capacity, capacity / PERIODS[period.strip() or 'second'])
+
+
+def forwarded_client(remote_addr, forwarded_for, hops):
+    """The client address as ``ProxyFix(x_for=hops)`` sees it, for requests that bypass Flask."""
+    addresses = [address.strip() for address in (forwarded_for or '').split(',') if address.strip()]
+    if hops and len(addresses) >= hops:
+        return addresses[-hops]
+    return remote_addr
+
+
+class MemoryBackend:
+    """Token buckets in this process only.
+
+    With several workers every worker enforces the limits on its own, so a
+    client can get up to one full bucket per worker. The least recently
+    used buckets are dropped beyond ``max_keys``, which at worst refills them.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_keys=config['RATE_LIMIT_MAX_KEYS'])
+
+    def take(self, requests, cost=1):
+        """Take ``cost`` tokens from every bucket in ``requests`` or from none.
+
+        ``requests`` is a list of ``(key, rule)``. Returns ``None`` if the
+        tokens were taken, otherwise ``(key, retry_after_seconds)`` for the
+        bucket that ran out.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rule in requests:
+                tokens, updated_at = self._buckets.get(key, (rule.capacity, now))
+                tokens = min(rule.capacity, tokens + (now - updated_at) * rule.rate)
+                if tokens < cost:
+                    return key, (cost - tokens) / rule.rate
+                levels.append((key, tokens))
+            for key, tokens in levels:
+                self._buckets[key] = [tokens - cost, now]
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return None
+
+
+class DatabaseBackend:
+    """Token buckets in the ``rate_limit_bucket`` table, shared by every worker.
+
+    Each bucket is refilled and debited by a single conditional UPDATE, and
+    all buckets of a request are taken in one transaction that is rolled
+    back if any of them is empty, so concurrent workers never overdraw.
+    """
+
+    def __init__(self, bucket_ttl=86400.0, prune_probability=0.01):
+        self.bucket_ttl = bucket_ttl
+        self.prune_probability = prune_probability
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(bucket_ttl=config['RATE_LIMIT_BUCKET_TTL'])
+
+    @staticmethod
+    def _refilled(rule, now):
+        refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rule.rate
+        return case((refilled > rule.capacity, rule.capacity), else_=refilled)
+
+    def take(self, requests, cost=1):
+        now = time.time()
+        table = RateLimitBucket.__table__
+        with db.engine.connect() as connection:
+            with connection.begin() as transaction:
+                for key, rule in requests:
+                    exists = select(table.c.key).where(table.c.key == key).exists()
+                    connection.execute(insert(table).from_select(
+                        ['key', 'tokens', 'updated_at'],
+                        select(literal(key), literal(rule.capacity), literal(now)).where(~exists)
+                    ))
+                    refilled = self._refilled(rule, now)
+                    taken = connection.execute(
+                        update(table).where(table.c.key == key, refilled >= cost)
+                        .values(tokens=refilled - cost, updated_at=now)
+                    ).rowcount
+                    if not taken:
+                        tokens = connection.execute(select(refilled).where(table.c.key == key)).scalar()
+                        transaction.rollback()
+                        return key, (cost - tokens) / rule.rate
+                if random.random() < self.prune_probability:
+                    connection.execute(delete(table).where(table.c.updated_at < now - self.bucket_ttl))
+        return None
+
+
+# Built-in backends for RATE_LIMIT_BACKEND, see load_backend(); others need
+# from_config(config) and take(requests, cost)
+BACKENDS = {
+    'memory': MemoryBackend,
+    'database': DatabaseBackend,
+}
+
+
+class RateLimiter:
+    """Protects the LLM from chat turns arriving faster than people type.
+
+    Every turn takes a token from the buckets of its invitation, of the user
+    the feedback is about and of the client IP (``RATE_LIMIT_INVITE``,
+    ``RATE_LIMIT_USER``, ``RATE_LIMIT_IP``) and is refused with a 429 if one
+    is empty. Turns that pass are then admitted only while fewer than
+    ``LLM_ADMISSION_CAPACITY`` are in flight in this process; beyond that
+    they are refused at once with a 503 instead of queueing for the LLM.
+    """
+
+    SCOPES = ('invite', 'user', 'ip')
+
+    def __init__(self):
+        self.rules = {}
+        self.backend = None
+        self.capacity = 0
+        self.retry_after = 1.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.rules = {scope: parse_rule(config[f'RATE_LIMIT_{scope.upper()}']) for scope in self.SCOPES}
+        self.backend = load_backend(config['RATE_LIMIT_BACKEND'], BACKENDS).from_config(config)
+        self.capacity = config['LLM_ADMISSION_CAPACITY'] or (
+            config['LLM_ASYNC_MAX_CONCURRENCY'] if config['SERVER_MODE'] == 'asgi'
+            else 2 * config['LLM_MAX_CONCURRENCY']
+        )
+        self.retry_after = config['LLM_ADMISSION_RETRY_AFTER']
+        app.extensions['rate_limiter'] = self
+
+    def admit(self, giver_id, user_id, remote_addr):
+        """Admit a chat turn or refuse it.
+
+        Returns ``None`` if the turn may call the LLM, in which case the
+        caller must call :meth:`release` once the call is over, or a
+        :class:`Rejection`.
+        """
+        identities = {'invite': giver_id, 'user': user_id, 'ip': remote_addr}
+        requests = [(f'{scope}:{identities[scope]}', rule) for scope, rule in self.rules.items()
+                    if rule is not None and identities[scope] is not None]
+        if requests:
+            refused = self.backend.take(requests)
+            if refused is not None:
+                key, retry_after = refused
+                RATE_LIMITED.inc(scope=key.partition(':')[0])
+                return Rejection(429, 'You are sending messages too quickly. Please wait a moment.', retry_after)
+
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                ADMISSION_REJECTED.inc()
+                return Rejection(503, 'The assistant is busy right now, please try again shortly.',
+                                 self.retry_after)
+            self._in_flight += 1
+        CHAT_TURNS_IN_FLIGHT.inc()
+        return None
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        CHAT_TURNS_IN_FLIGHT.dec()
+
+
+rate_limiter = RateLimiter()
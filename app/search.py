@@ -0,0 +1,107 @@
+import re
+from collections import namedtuple
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import and_, func, select, text
+from .models import db, Feedback, FeedbackGiver
+from .listing import MAX_PAGE_SIZE
+
+# snippet() wraps matches in these; they cannot be typed into a chat, so
+# they survive HTML escaping and are swapped for <mark> tags afterwards
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+TERM_RE = re.compile(r'\w+\*?')
+
+SearchHit = namedtuple('SearchHit', ['id', 'giver_email', 'snippet', 'score'])
+SearchPage = namedtuple('SearchPage', ['hits', 'page', 'has_next'])
+
+FTS_SEARCH = text(
+    'SELECT feedback.id, feedback_giver.email, '
+    "snippet(feedback_fts, 0, :start, :end, '...', :tokens), feedback_fts.rank "
+    'FROM feedback_fts '
+    'JOIN feedback ON feedback.id = feedback_fts.rowid '
+    'JOIN feedback_giver ON feedback_giver.id = feedback.giver_id '
+    'WHERE feedback_fts MATCH :match '
+    'ORDER BY feedback_fts.rank LIMIT :limit OFFSET :offset'
+)
+
+
+def fts_query(q, user_id):
+    """Turn free text into an FTS5 query for ``user_id``'s feedback containing all of its words.
+
+    Each word is quoted, so FTS operators and punctuation typed by the user
+    are matched literally instead of raising a syntax error; a trailing
+    ``*`` is kept for prefix searches. Returns ``None`` if ``q`` has no words.
+    """
+    terms = []
+    for term in TERM_RE.findall(q):
+        word = term.rstrip('*')
+        terms.append(f'content:"{word}"*' if term.endswith('*') else f'content:"{word}"')
+    if not terms:
+        return None
+    return f'owner:"u{user_id}" AND ' + ' AND '.join(terms)
+
+
+def highlight(snippet):
+    """Escape ``snippet`` and mark up the matched words."""
+    return Markup(str(escape(snippet)).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+def _fts_search(match, limit, offset):
+    rows = db.session.execute(FTS_SEARCH, {
+        'start': HIGHLIGHT_START,
+        'end': HIGHLIGHT_END,
+        'tokens': current_app.config['SEARCH_SNIPPET_TOKENS'],
+        'match': match,
+        'limit': limit,
+        'offset': offset,
+    }).all()
+    # bm25() is lower for better matches; flip it so higher scores are better
+    return [(feedback_id, email, snippet, -rank) for feedback_id, email, snippet, rank in rows]
+
+
+def _like_search(user_id, q, limit, offset):
+    # Databases without FTS5: unranked substring match on every word
+    config = current_app.config
+    words = [term.rstrip('*') for term in TERM_RE.findall(q)]
+    return db.session.execute(
+        select(Feedback.id, FeedbackGiver.email,
+               func.substr(Feedback.content, 1, config['FEEDBACK_PREVIEW_CHARS']), 0.0)
+        .join(Feedback.giver)
+        .where(Feedback.user_id == user_id, and_(*(Feedback.content.ilike(f'%{word}%') for word in words)))
+        .order_by(Feedback.id.desc())
+        .limit(limit).offset(offset)
+    ).all()
+
+
+def search_feedback(user_id, q, page=1, limit=None):
+    """Return one page of ``user_id``'s feedback matching ``q``, best match first.
+
+    Matches come from the ``feedback_fts`` index (see migration 4), ranked
+    by BM25 over the content column, each with a short snippet around the
+    matched words. Pages are numbered from 1.
+    """
+    limit = max(1, min(limit or current_app.config['FEEDBACK_PAGE_SIZE'], MAX_PAGE_SIZE))
+    page = max(page or 1, 1)
+    match = fts_query(q or '', user_id)
+    if match is None:
+        return SearchPage([], page, False)
+
+    # One extra row tells whether there is a next page
+    offset = (page - 1) * limit
+    if db.session.get_bind().dialect.name == 'sqlite':
+        rows = _fts_search(match, limit + 1, offset)
+    else:
+        rows = _like_search(user_id, q, limit + 1, offset)
+
+    hits = [SearchHit(row[0], row[1], highlight(row[2]), row[3]) for row in rows[:limit]]
+    return SearchPage(hits, page, len(rows) > limit)
+
+
+def search_hit_to_dict(hit):
+    return {
+        'id': hit.id,
+        'giver_email': hit.giver_email,
+        'snippet': str(hit.snippet),
+        'score': hit.score,
+    }
@@ -0,0 +1,49 @@
+import hashlib
+from functools import wraps
+from flask import current_app, make_response, request
+from jinja2 import FileSystemBytecodeCache
+
+
+def init_templates(app):
+    """Compile every template once at startup.
+
+    Jinja keeps compiled templates in ``app.jinja_env`` and, unless
+    ``TEMPLATES_AUTO_RELOAD`` is on, never re-parses them. With
+    ``TEMPLATE_BYTECODE_CACHE_DIR`` set, the compiled code is also written
+    to disk so the next process start skips compilation.
+    """
+    cache_dir = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if cache_dir:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if app.config.get('TEMPLATES_PRECOMPILE'):
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+
+    app.extensions['page_cache'] = {}
+
+
+def cached_page(view):
+    """Cache the rendered output of a view that is identical for every visitor.
+
+    The body is rendered once per URL and served with an ``ETag``, so
+    repeat visits get a ``304 Not Modified``. Only use it for views that do
+    not depend on the session, the current user or flashed messages.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions['page_cache']
+        # The page only contains relative links, so the host and query string do not matter
+        key = request.script_root + request.path
+        entry = cache.get(key)
+        if entry is None:
+            body = view(*args, **kwargs)
+            entry = cache[key] = (body, hashlib.sha1(body.encode('utf-8')).hexdigest())
+
+        body, etag = entry
+        response = make_response(body)
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['PAGE_CACHE_MAX_AGE']
+        return response.make_conditional(request)
+    return wrapper
@@ -0,0 +1,6 @@
+# ASGI entry point, e.g. `uvicorn asgi:app --host 0.0.0.0 --port 8080`; the
+# lifespan startup migrates the database and starts the outbox mail worker
+from app import create_app
+from app.asgi import create_asgi_app
+
+app = create_asgi_app(create_app())
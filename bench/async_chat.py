@@ -0,0 +1,122 @@
+"""Concurrent in-flight chats: ASGI async endpoint vs WSGI threads.
+
+Both modes get the same number of worker threads. The WSGI run pushes the
+chats through a thread pool of that size, as a threaded server would; the
+ASGI run calls the ASGI application directly on one event loop whose
+default executor (used only for the short database steps) has that many
+threads.
+
+    python -m bench.async_chat --chats 200 --threads 4 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from app import create_app
+from app.asgi import create_asgi_app
+from app.invitations import generate_invite_token
+from app.migrations import upgrade_database
+from app.models import db, User, FeedbackGiver
+
+
+def setup(args):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'LLM_BACKEND': 'fake',
+        'SECRET_KEY': 'bench',
+        'FAKE_LLM_FIRST_TOKEN_DELAY': args.latency,
+        'FAKE_LLM_TOKEN_DELAY': 0.0,
+        'LLM_MAX_CONCURRENCY': args.chats,
+        'LLM_ASYNC_MAX_CONCURRENCY': args.chats,
+        'LLM_QUEUE_TIMEOUT': 600,
+        # Every simulated client shares one IP and user; measure the LLM path, not the limiter
+        'RATE_LIMIT_INVITE': '',
+        'RATE_LIMIT_USER': '',
+        'RATE_LIMIT_IP': '',
+        'LLM_ADMISSION_CAPACITY': 2 * args.chats,
+    })
+    with app.app_context():
+        upgrade_database()
+        user = User(username='bench', email='bench@example.com', password='bench',
+                    first_name='Bench', last_name='User')
+        db.session.add(user)
+        db.session.commit()
+        givers = [FeedbackGiver(user_id=user.id, email=f'giver{i}@example.com', token=str(uuid.uuid4()))
+                  for i in range(2 * args.chats)]
+        db.session.add_all(givers)
+        db.session.commit()
+        tokens = [generate_invite_token(giver.id, user.id) for giver in givers]
+    return app, tokens[:args.chats], tokens[args.chats:]
+
+
+def run_wsgi(app, tokens, threads):
+    def chat(token):
+        client = app.test_client()
+        response = client.post(f'/feedback/feedback_stream?token={token}', data={'message': 'hello'})
+        return b'event: done' in response.data
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        ok = sum(pool.map(chat, tokens))
+    return ok, time.perf_counter() - start
+
+
+async def _asgi_chat(application, token):
+    body = urlencode({'message': 'hello'}).encode()
+    sent = False
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    scope = {
+        'type': 'http', 'method': 'POST', 'path': '/feedback/feedback_stream',
+        'query_string': f'token={token}'.encode(), 'headers': [], 'http_version': '1.1',
+        'scheme': 'http', 'server': ('localhost', 80), 'root_path': '',
+    }
+    await application(scope, receive, send)
+    return b'event: done' in b''.join(chunks)
+
+
+def run_asgi(app, tokens, threads):
+    application = create_asgi_app(app)
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(threads))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_asgi_chat(application, token) for token in tokens))
+        return sum(results), time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=1.0)
+    args = parser.parse_args()
+
+    app, wsgi_tokens, asgi_tokens = setup(args)
+    for name, runner, tokens in [('wsgi', run_wsgi, wsgi_tokens), ('asgi', run_asgi, asgi_tokens)]:
+        ok, elapsed = runner(app, tokens, args.threads)
+        print(f'{name}: {ok}/{len(tokens)} chats in {elapsed:6.2f}s '
+              f'({ok / elapsed:6.1f} chats/s, ~{ok * args.latency / elapsed:5.1f} in flight on {args.threads} threads)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare the blocking chat turn with the streaming endpoint.
+
+Runs entirely offline against the fake LLM backend and reports, per turn,
+time-to-first-byte of the reply and how long the worker thread was occupied.
+
+    python -m bench.chat_stream --turns 5 --first-token-delay 0.5 --token-delay 0.02
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from app import create_app
+from app.migrations import upgrade_database
+from app.models import db, User, FeedbackGiver
+
+
+def setup(args):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'LLM_BACKEND': 'fake',
+        'FAKE_LLM_FIRST_TOKEN_DELAY': args.first_token_delay,
+        'FAKE_LLM_TOKEN_DELAY': args.token_delay,
+        'SERVER_NAME': 'localhost',
+        # Every simulated client shares one IP and user; measure the LLM path, not the limiter
+        'RATE_LIMIT_INVITE': '',
+        'RATE_LIMIT_USER': '',
+        'RATE_LIMIT_IP': '',
+        'LLM_ADMISSION_CAPACITY': 10000,
+    })
+    with app.app_context():
+        upgrade_database()
+        user = User(username='bench', email='bench@example.com', password='bench',
+                    first_name='Bench', last_name='User')
+        db.session.add(user)
+        db.session.commit()
+        tokens = []
+        for _ in range(2):
+            giver = FeedbackGiver(user_id=user.id, email='giver@example.com', token=str(uuid.uuid4()))
+            db.session.add(giver)
+            tokens.append(giver.token)
+        db.session.commit()
+    return app, tokens
+
+
+def run_blocking(client, token, turns):
+    first, total = [], []
+    for i in range(turns):
+        start = time.perf_counter()
+        response = client.post(f'/feedback/feedback_page?token={token}', data={'message': f'turn {i}'})
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+        # The reply is only visible once the whole page has been rendered
+        first.append(elapsed)
+        total.append(elapsed)
+    return first, total
+
+
+def run_streaming(client, token, turns):
+    first, total = [], []
+    for i in range(turns):
+        start = time.perf_counter()
+        response = client.post(f'/feedback/feedback_stream?token={token}', data={'message': f'turn {i}'},
+                               buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        first.append(time.perf_counter() - start)
+        for _ in chunks:
+            pass
+        response.close()
+        total.append(time.perf_counter() - start)
+    return first, total
+
+
+def report(name, first, total):
+    print(f'{name:10s} time-to-first-token p50={statistics.median(first) * 1000:8.1f}ms '
+          f'max={max(first) * 1000:8.1f}ms | worker occupancy p50={statistics.median(total) * 1000:8.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--first-token-delay', type=float, default=0.5)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    args = parser.parse_args()
+
+    app, (blocking_token, streaming_token) = setup(args)
+    client = app.test_client()
+    report('blocking', *run_blocking(client, blocking_token, args.turns))
+    report('streaming', *run_streaming(client, streaming_token, args.turns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Compare two end-to-end benchmark result files.
+
+Flags endpoints whose p95 latency or queries per request got worse by more
+than the threshold; exits non-zero if any regression is found.
+
+    python -m bench.compare bench/results/old.json bench/results/new.json --threshold 0.2
+"""
+import argparse
+import json
+import sys
+
+METRICS = [('p50_ms', 'p50'), ('p95_ms', 'p95'), ('p99_ms', 'p99'), ('queries_mean', 'q/req')]
+GATED = {'p95_ms', 'queries_mean'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative increase')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f'baseline {baseline["commit"]} vs candidate {candidate["commit"]}')
+    regressions = []
+    for endpoint, new in candidate['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if old is None:
+            print(f'{endpoint:40s} (new endpoint)')
+            continue
+        cells = []
+        for key, label in METRICS:
+            before, after = old[key], new[key]
+            change = (after - before) / before if before else 0.0
+            cells.append(f'{label} {before:7.1f} -> {after:7.1f} ({change:+.0%})')
+            if key in GATED and change > args.threshold:
+                regressions.append(f'{endpoint} {label} {change:+.0%}')
+        print(f'{endpoint:40s} ' + ' | '.join(cells))
+
+    if regressions:
+        print('\nRegressions:\n  ' + '\n  '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""End-to-end load test of the real app with local SMTP and LLM stand-ins.
+
+Drives ``create_app()`` through signup, login, bulk invites from the
+command center, multi-turn chats on the feedback page and dashboard reads,
+with every user journey running in its own thread. Reports throughput,
+p50/p95/p99 latency and database queries per request for each endpoint,
+and writes the results to JSON for comparison between commits
+(see ``bench/compare.py``).
+
+    python -m bench.e2e --users 20 --invites 10 --turns 4 --concurrency 8
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+from app import create_app
+from app.mailer import MailWorker
+from app.migrations import upgrade_database
+from app.models import db, OutboxMessage
+from bench.fake_smtp import FakeSMTPServer
+
+TOKEN_RE = re.compile(r'token=(\S+)')
+
+
+class Recorder:
+    """Collects latency and query counts per endpoint across threads."""
+
+    def __init__(self, engine):
+        self.samples = defaultdict(list)  # endpoint -> [(seconds, queries, status)]
+        self.phases = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._on_query)
+
+    def _on_query(self, *args):
+        self._local.queries = getattr(self._local, 'queries', 0) + 1
+
+    def request(self, endpoint, send):
+        self._local.queries = 0
+        start = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[endpoint].append((elapsed, self._local.queries, response.status_code))
+        return response
+
+    def phase(self, name, fn, items, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(fn, items))
+        self.phases[name] = time.perf_counter() - start
+        return results
+
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def summarize(recorder, phase_of):
+    results = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        latencies = [sample[0] for sample in samples]
+        queries = [sample[1] for sample in samples]
+        wall = recorder.phases[phase_of[endpoint]]
+        results[endpoint] = {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[2] >= 500),
+            'throughput_rps': len(samples) / wall,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_mean': statistics.fmean(queries),
+            'queries_max': max(queries),
+        }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--invites', type=int, default=10, help='invitations per user')
+    parser.add_argument('--turns', type=int, default=4, help='chat turns per giver')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--smtp-connect-delay', type=float, default=0.02)
+    parser.add_argument('--output', help='results file (default: bench/results/<commit>-<time>.json)')
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(connect_delay=args.smtp_connect_delay).start()
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'LLM_BACKEND': 'fake',
+        'SECRET_KEY': 'bench',
+        'FAKE_LLM_FIRST_TOKEN_DELAY': args.llm_latency,
+        'FAKE_LLM_TOKEN_DELAY': 0.0,
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': smtp.port,
+        'MAIL_USE_TLS': False,
+        'MAIL_USERNAME': None,
+        'MAIL_PASSWORD': None,
+        'MAIL_DEFAULT_SENDER': 'bench@example.com',
+        'MAIL_RATE_LIMIT': 0,
+        # Every simulated client shares one IP and user; measure the LLM path, not the limiter
+        'RATE_LIMIT_INVITE': '',
+        'RATE_LIMIT_USER': '',
+        'RATE_LIMIT_IP': '',
+        'LLM_ADMISSION_CAPACITY': 10000,
+    })
+    with app.app_context():
+        upgrade_database()
+        recorder = Recorder(db.engine)
+
+    users = [f'user{i}' for i in range(args.users)]
+    clients = {}
+    phase_of = {}
+
+    def call(phase, endpoint, send):
+        phase_of[endpoint] = phase
+        return recorder.request(endpoint, send)
+
+    def signup(name):
+        client = clients[name] = app.test_client()
+        call('signup', 'POST /auth/signup', lambda: client.post('/auth/signup', data={
+            'username': name, 'first_name': 'Bench', 'last_name': name, 'email': f'{name}@example.com',
+            'password': 'secret', 'job_title': 'FSO', 'company': 'State',
+        }))
+
+    def login(name):
+        call('login', 'POST /auth/login', lambda: clients[name].post(
+            '/auth/login', data={'username': name, 'password': 'secret'}))
+
+    def invite(name):
+        emails = '\n'.join(f'{name}-giver{i}@example.com' for i in range(args.invites))
+        call('invite', 'POST /command_center/', lambda: clients[name].post(
+            '/command_center/', data={'emails': emails}))
+
+    def chat(token):
+        client = app.test_client()
+        url = f'/feedback/feedback_page?token={token}'
+        call('chat', 'GET /feedback/feedback_page', lambda: client.get(url))
+        for turn in range(args.turns):
+            call('chat', 'POST /feedback/feedback_page (turn)', lambda: client.post(
+                url, data={'message': f'Turn {turn}: they led the visa backlog project well.'}))
+        call('chat', 'POST /feedback/feedback_page (end_chat)', lambda: client.post(
+            url, data={'message': 'done', 'end_chat': '1'}))
+
+    def read_dashboard(name):
+        call('dashboard', 'GET /dashboard/dashboard', lambda: clients[name].get('/dashboard/dashboard'))
+        call('dashboard', 'GET /command_center/', lambda: clients[name].get('/command_center/'))
+        call('dashboard', 'GET /dashboard/api/feedback', lambda: clients[name].get('/dashboard/api/feedback'))
+
+    recorder.phase('signup', signup, users, args.concurrency)
+    recorder.phase('login', login, users, args.concurrency)
+    recorder.phase('invite', invite, users, args.concurrency)
+
+    with app.app_context():
+        bodies = db.session.scalars(db.select(OutboxMessage.body)
+                                    .where(OutboxMessage.subject == 'Your Feedback Invitation')).all()
+        tokens = [TOKEN_RE.search(body).group(1) for body in bodies]
+        start = time.perf_counter()
+        delivered = MailWorker(app).drain()
+        mail_seconds = time.perf_counter() - start
+
+    recorder.phase('chat', chat, tokens, args.concurrency)
+    recorder.phase('dashboard', read_dashboard, users, args.concurrency)
+    smtp.stop()
+
+    results = summarize(recorder, phase_of)
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'config': vars(args),
+        'endpoints': results,
+        'mail': {'delivered': delivered, 'throughput_mps': delivered / mail_seconds if mail_seconds else None,
+                 'smtp_connections': smtp.connections},
+    }
+
+    print(f'{"endpoint":40s} {"reqs":>5s} {"err":>4s} {"rps":>8s} {"p50ms":>8s} {"p95ms":>8s} '
+          f'{"p99ms":>8s} {"q/req":>6s} {"qmax":>5s}')
+    for endpoint, stats in results.items():
+        print(f'{endpoint:40s} {stats["requests"]:5d} {stats["errors"]:4d} {stats["throughput_rps"]:8.1f} '
+              f'{stats["p50_ms"]:8.1f} {stats["p95_ms"]:8.1f} {stats["p99_ms"]:8.1f} '
+              f'{stats["queries_mean"]:6.1f} {stats["queries_max"]:5d}')
+    print(f'mail: {delivered} delivered over {smtp.connections} SMTP connection(s)')
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), 'results',
+        f'{report["commit"]}-{datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Minimal local SMTP sink for offline mail benchmarks.
+
+Speaks just enough SMTP for smtplib/Flask-Mail (no TLS, no auth) and
+counts delivered messages. ``connect_delay`` simulates the TCP/TLS
+handshake cost of a real provider, ``message_delay`` the per-message cost.
+
+    python -m bench.fake_smtp --port 8025
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.connect_delay)
+        self._reply('220 localhost fake-smtp ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip().upper()
+            if command.startswith('EHLO'):
+                self._reply('250-localhost')
+                self._reply('250 8BITMIME')
+            elif command.startswith('HELO'):
+                self._reply('250 localhost')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self._reply('250 OK')
+            elif command == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                time.sleep(server.message_delay)
+                with server.lock:
+                    server.messages += 1
+                self._reply('250 OK: queued')
+            elif command == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, connect_delay=0.0, message_delay=0.0):
+        super().__init__((host, port), _Handler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--connect-delay', type=float, default=0.0)
+    parser.add_argument('--message-delay', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, args.connect_delay, args.message_delay)
+    print(f'Fake SMTP sink listening on {args.host}:{server.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f'\n{server.messages} messages over {server.connections} connections')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Load-test the chat flow against the fake LLM backend.
+
+Runs concurrent givers through the blocking chat turn and reports
+latency percentiles, how many turns were refused by the LLM client
+(concurrency limit or open circuit) and the breaker state.
+
+    python -m bench.llm_load --givers 32 --turns 3 --max-concurrency 8 --latency 0.5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+from app import create_app
+from app.invitations import generate_invite_token
+from app.llm import get_llm
+from app.migrations import upgrade_database
+from app.models import db, User, FeedbackGiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--givers', type=int, default=32)
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--queue-timeout', type=float, default=5.0)
+    parser.add_argument('--latency', type=float, default=0.5, help='fake time to first token')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'LLM_BACKEND': 'fake',
+        'SECRET_KEY': 'bench',
+        'FAKE_LLM_FIRST_TOKEN_DELAY': args.latency,
+        'FAKE_LLM_TOKEN_DELAY': 0.0,
+        'FAKE_LLM_FAILURE_RATE': args.failure_rate,
+        'LLM_MAX_CONCURRENCY': args.max_concurrency,
+        'LLM_QUEUE_TIMEOUT': args.queue_timeout,
+        'LLM_RETRY_BASE_DELAY': 0.05,
+        # Every simulated client shares one IP and user; measure the LLM path, not the limiter
+        'RATE_LIMIT_INVITE': '',
+        'RATE_LIMIT_USER': '',
+        'RATE_LIMIT_IP': '',
+        'LLM_ADMISSION_CAPACITY': 10000,
+    })
+    with app.app_context():
+        upgrade_database()
+        user = User(username='bench', email='bench@example.com', password='bench',
+                    first_name='Bench', last_name='User')
+        db.session.add(user)
+        db.session.commit()
+        givers = [FeedbackGiver(user_id=user.id, email=f'giver{i}@example.com', token=str(uuid.uuid4()))
+                  for i in range(args.givers)]
+        db.session.add_all(givers)
+        db.session.commit()
+        tokens = [generate_invite_token(giver.id, user.id) for giver in givers]
+
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def giver(token):
+        client = app.test_client()
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            response = client.post(f'/feedback/feedback_page?token={token}', data={'message': f'turn {turn}'})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if b'assistant is unavailable' in response.data:
+                    failures.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=giver, args=(token,)) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{len(latencies)} turns in {wall:.2f}s ({len(latencies) / wall:.1f} turns/s)')
+    print(f'latency p50={quantiles[49] * 1000:.0f}ms p95={quantiles[94] * 1000:.0f}ms '
+          f'p99={quantiles[98] * 1000:.0f}ms')
+    print(f'refused or failed turns: {len(failures)}')
+    with app.app_context():
+        print(f'circuit breaker: {get_llm().breaker.state}')
+
+
+if __name__ == '__main__':
+    main()
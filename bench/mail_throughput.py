@@ -0,0 +1,67 @@
+"""Mail delivery throughput: one SMTP connection per message vs the outbox worker.
+
+    python -m bench.mail_throughput --messages 200 --connect-delay 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from flask_mail import Message
+
+from app import create_app
+from app.mailer import MailWorker, enqueue_mail
+from app.migrations import upgrade_database
+from app.models import db, OutboxMessage
+from bench.fake_smtp import FakeSMTPServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--connect-delay', type=float, default=0.05,
+                        help='simulated TCP/TLS handshake per connection (seconds)')
+    parser.add_argument('--message-delay', type=float, default=0.0)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(connect_delay=args.connect_delay, message_delay=args.message_delay).start()
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': server.port,
+        'MAIL_USE_TLS': False,
+        'MAIL_USERNAME': None,
+        'MAIL_PASSWORD': None,
+        'MAIL_DEFAULT_SENDER': 'bench@example.com',
+        'MAIL_RATE_LIMIT': 0,
+        'MAIL_BATCH_SIZE': args.batch_size,
+    })
+
+    with app.app_context():
+        upgrade_database()
+        mail = app.extensions['mail']
+
+        start = time.perf_counter()
+        for i in range(args.messages):
+            mail.send(Message(f'Direct {i}', recipients=[f'user{i}@example.com'], body='Hello'))
+        direct = time.perf_counter() - start
+
+        for i in range(args.messages):
+            enqueue_mail(f'Outbox {i}', [f'user{i}@example.com'], 'Hello')
+        db.session.commit()
+        connections_before = server.connections
+        start = time.perf_counter()
+        processed = MailWorker(app).drain()
+        outbox = time.perf_counter() - start
+        sent = OutboxMessage.query.filter_by(status='sent').count()
+
+    server.stop()
+    print(f'direct send : {args.messages / direct:8.1f} msg/s ({args.messages} connections)')
+    print(f'outbox drain: {processed / outbox:8.1f} msg/s ({server.connections - connections_before} connections, '
+          f'{sent} sent)')
+
+
+if __name__ == '__main__':
+    main()
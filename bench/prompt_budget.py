@@ -0,0 +1,73 @@
+"""Per-turn prompt tokens with and without context-window budgeting.
+
+Simulates a long chat against the fake LLM backend and prints, for every
+turn, the prompt tokens that the full history would cost next to what
+``build_prompt`` actually sends.
+
+    python -m bench.prompt_budget --turns 40 --budget 2000 --recent 6
+"""
+import argparse
+import os
+import tempfile
+import uuid
+
+from app import create_app
+from app.conversations import conversation_store
+from app.llm import complete_chat
+from app.migrations import upgrade_database
+from app.models import db, User, FeedbackGiver
+from app.prompting import SYSTEM_PROMPT, build_prompt, prompt_tokens
+
+ANSWER = ("We worked together on the consular backlog project for about eight months. "
+          "She pulled the team together after the staffing cuts and rebuilt the appointment "
+          "schedule, and she was very direct with the front office about what we could deliver. ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=40)
+    parser.add_argument('--budget', type=int, default=2000)
+    parser.add_argument('--recent', type=int, default=6)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'LLM_BACKEND': 'fake',
+        'FAKE_LLM_FIRST_TOKEN_DELAY': 0.0,
+        'FAKE_LLM_TOKEN_DELAY': 0.0,
+        'LLM_PROMPT_TOKEN_BUDGET': args.budget,
+        'LLM_RECENT_TURNS': args.recent,
+    })
+
+    with app.test_request_context():
+        upgrade_database()
+        user = User(username='bench', email='bench@example.com', password='bench',
+                    first_name='Bench', last_name='User')
+        db.session.add(user)
+        db.session.commit()
+        giver = FeedbackGiver(user_id=user.id, email='giver@example.com', token=str(uuid.uuid4()))
+        db.session.add(giver)
+        db.session.commit()
+
+        full_total = sent_total = 0
+        print(f'{"turn":>4} {"full":>7} {"sent":>7} {"summary":>8} {"verbatim":>9} {"folded":>7}')
+        for turn in range(1, args.turns + 1):
+            conversation_store.append(giver.id, 'user', f'[{turn}] {ANSWER}')
+            history = conversation_store.history(giver.id)
+            messages, stats = build_prompt(giver.id, history)
+            conversation_store.append(giver.id, 'assistant', complete_chat(messages))
+
+            # What the prompt would cost without budgeting
+            full_tokens = prompt_tokens([{'role': 'system', 'content': SYSTEM_PROMPT}] + history)
+            full_total += full_tokens
+            sent_total += stats.total_tokens
+            print(f'{turn:4d} {full_tokens:7d} {stats.total_tokens:7d} '
+                  f'{stats.summary_tokens:8d} {stats.turns_sent:9d} {stats.turns_summarized:7d}')
+
+        print(f'\nprompt tokens over {args.turns} turns: full history {full_total}, '
+              f'budgeted {sent_total} ({100 * sent_total / full_total:.0f}%)')
+
+
+if __name__ == '__main__':
+    main()
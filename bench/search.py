@@ -0,0 +1,129 @@
+"""Feedback search latency: FTS5 index versus a LIKE scan.
+
+Fills a database with synthetic transcripts (the FTS triggers index them
+as they are inserted), then times ``search_feedback`` against ``LIKE
+'%word%'`` queries scoped to one user. ``like`` stops at the first page of
+matches in id order; ``like-all`` reads every match, which is what any
+relevance ordering (or a search for a word that is not there) costs.
+Words follow a Zipf distribution over a 5,000 word vocabulary, with the
+topical words placed so each appears in a few percent of transcripts;
+``--vocabulary 0`` uses only the topical words, so every transcript matches
+the common terms (the worst case for ranking).
+
+    python -m bench.search --rows 100000 --users 20
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import func, insert, select
+
+from app import create_app
+from app.migrations import upgrade_database
+from app.models import db, Feedback, FeedbackGiver, User
+from app.search import search_feedback
+
+VOCABULARY = ('project team embassy consular visa backlog deadline colleague communication '
+              'meeting report budget training mentor policy negotiation crisis schedule '
+              'stakeholder workload morale analysis cable briefing delegation').split()
+RARE_WORDS = ['leadership', 'kilimanjaro', 'ombudsman']
+TOPIC_RANK = 200
+QUERIES = [('common', 'visa backlog'), ('rare', 'kilimanjaro'), ('prefix', 'negotiat*'),
+           ('all-words', 'crisis communication team'), ('no-match', 'zanzibar')]
+
+
+def word_distribution(size):
+    if not size:
+        return VOCABULARY, None
+    filler = [f'w{i}' for i in range(size - len(VOCABULARY))]
+    words = filler[:TOPIC_RANK] + VOCABULARY + filler[TOPIC_RANK:]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return words, cum_weights
+
+
+def transcript(rng, words, cum_weights):
+    turns = []
+    for _ in range(rng.randint(4, 12)):
+        words_said = rng.choices(words, cum_weights=cum_weights, k=rng.randint(15, 40))
+        if rng.random() < 0.01:
+            words_said.append(rng.choice(RARE_WORDS))
+        turns.append(f"{rng.choice(['user', 'assistant'])}: {' '.join(words_said)}.")
+    return '\n'.join(turns)
+
+
+def populate(args):
+    rng = random.Random(args.seed)
+    words, cum_weights = word_distribution(args.vocabulary)
+    db.session.execute(insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x', 'first_name': 'Bench',
+         'last_name': str(i)} for i in range(args.users)
+    ])
+    user_ids = db.session.scalars(select(User.id)).all()
+    start = time.perf_counter()
+    for offset in range(0, args.rows, 5000):
+        batch = min(5000, args.rows - offset)
+        givers = [{'user_id': rng.choice(user_ids), 'email': f'giver{offset + i}@example.com',
+                   'token': f'bench-{offset + i}', 'completed': True} for i in range(batch)]
+        giver_ids = db.session.scalars(
+            insert(FeedbackGiver).returning(FeedbackGiver.id, sort_by_parameter_order=True), givers).all()
+        db.session.execute(insert(Feedback), [
+            {'user_id': giver['user_id'], 'giver_id': giver_id, 'content': transcript(rng, words, cum_weights)}
+            for giver, giver_id in zip(givers, giver_ids)
+        ])
+        db.session.commit()
+    elapsed = time.perf_counter() - start
+    print(f'inserted {args.rows} transcripts in {elapsed:.1f}s ({args.rows / elapsed:.0f}/s, indexed by triggers)')
+    return user_ids[0]
+
+
+def like_search(user_id, q, limit=None):
+    query = select(Feedback.id).where(Feedback.user_id == user_id)
+    for word in q.replace('*', '').split():
+        query = query.where(Feedback.content.like(f'%{word}%'))
+    return db.session.scalars(query.order_by(Feedback.id.desc()).limit(limit)).all()
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'LLM_BACKEND': 'fake'})
+    with app.app_context():
+        upgrade_database()
+        user_id = populate(args)
+        own_rows = db.session.scalar(select(func.count()).where(Feedback.user_id == user_id))
+        print(f'searching as user {user_id} ({own_rows} transcripts), median of {args.iterations} runs\n')
+
+        with app.test_request_context():
+            print(f'{"query":12s} {"terms":28s} {"hits":>5s} {"fts ms":>8s} {"like ms":>8s} {"like-all ms":>11s}')
+            for label, q in QUERIES:
+                page = search_feedback(user_id, q, limit=25)
+                fts_ms = timed(lambda: search_feedback(user_id, q, limit=25), args.iterations)
+                like_ms = timed(lambda: like_search(user_id, q, 25), args.iterations)
+                like_all_ms = timed(lambda: like_search(user_id, q), args.iterations)
+                hits = len(page.hits)
+                print(f'{label:12s} {q:28s} {hits:>4d}{"+" if page.has_next else " "} {fts_ms:8.2f} {like_ms:8.2f} '
+                      f'{like_all_ms:11.2f}')
+
+
+if __name__ == '__main__':
+    main()
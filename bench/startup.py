@@ -0,0 +1,72 @@
+"""Cold-start cost: importing the package, create_app() and the first responses.
+
+Every sample runs in a fresh interpreter, as after a scale-from-zero, with
+the configured backend (``openai`` by default, which never reaches the
+network here). Compares ``STARTUP_MODE=eager`` with ``lazy``; ``total`` is
+the wall-clock time from spawning the process until the first response
+has been served.
+
+    python -m bench.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from app import create_app
+from app.migrations import upgrade_database
+
+CHILD = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app({'SQLALCHEMY_DATABASE_URI': %(uri)r})
+created = time.perf_counter()
+client = application.test_client()
+client.get('/home')
+first = time.perf_counter()
+client.get('/auth/login')
+second = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_response': first - created, 'second_response': second - first,
+                  'to_first_response': first - started}))
+'''
+
+STAGES = ['import', 'create_app', 'first_response', 'second_response', 'to_first_response', 'total']
+
+
+def sample(uri, mode, backend):
+    env = dict(os.environ, STARTUP_MODE=mode, LLM_BACKEND=backend, MAIL_WORKER_ENABLED='0')
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD % {'uri': uri}], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--backend', default='openai')
+    args = parser.parse_args()
+
+    uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    with create_app({'SQLALCHEMY_DATABASE_URI': uri, 'LLM_BACKEND': 'fake'}).app_context():
+        upgrade_database()
+
+    print(f'median of {args.runs} fresh processes, milliseconds')
+    print(f'{"mode":8s}' + ''.join(f'{stage:>19s}' for stage in STAGES))
+    for mode in ('eager', 'lazy'):
+        runs = [sample(uri, mode, args.backend) for _ in range(args.runs)]
+        print(f'{mode:8s}' + ''.join(f'{statistics.median(run[stage] for run in runs) * 1000:19.1f}'
+                                     for stage in STAGES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Per-request template rendering cost before and after the template registry.
+
+Compares rendering each template from source on every call (what
+``render_template_string`` did) with rendering the precompiled template,
+and measures the fully cached ``/home`` page including 304 revalidation.
+
+    python -m bench.templates --iterations 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from flask import render_template, render_template_string
+
+from app import create_app
+from app.migrations import upgrade_database
+
+CONTEXT = {
+    'conversation_history': [{'role': 'user', 'content': 'hello'}, {'role': 'assistant', 'content': 'hi'}] * 5,
+    'token': 'bench-token',
+    'user_feedbacks': [],
+    'feedbacks': [],
+    'next_before': None,
+}
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        upgrade_database()
+
+    names = ['home/home.html', 'auth/login.html', 'auth/signup.html', 'feedback/chat.html']
+    with app.test_request_context('/'):
+        for name in names:
+            source = app.jinja_loader.get_source(app.jinja_env, name)[0]
+            before = timed(lambda: render_template_string(source, **CONTEXT), args.iterations)
+            after = timed(lambda: render_template(name, **CONTEXT), args.iterations)
+            print(f'{name:22s} from source {before:8.1f}us  precompiled {after:8.1f}us')
+
+    client = app.test_client()
+    etag = client.get('/home').headers['ETag']
+    full = timed(lambda: client.get('/home'), args.iterations // 4)
+    revalidate = timed(lambda: client.get('/home', headers={'If-None-Match': etag}), args.iterations // 4)
+    print(f'{"GET /home":22s} cached 200 {full:8.1f}us  304 {revalidate:8.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,20 @@
 from app import create_app
-from app.models import db
+from app.mailer import start_mail_worker
+from app.migrations import upgrade_database
 
 app = create_app()
 
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()  # Create tables if they don't exist
-    app.run(host='0.0.0.0', port=8080)
+    if app.config['SERVER_MODE'] == 'asgi':
+        # Async chat endpoint; migrations and the mail worker start with
+        # the ASGI lifespan, see app/asgi.py
+        import uvicorn
+        from app.asgi import create_asgi_app
+        uvicorn.run(create_asgi_app(app), host='0.0.0.0', port=8080)
+    else:
+        with app.app_context():
+            upgrade_database()  # Create or migrate the schema
+        if app.config['MAIL_WORKER_ENABLED']:
+            start_mail_worker(app)
+        app.run(host='0.0.0.0', port=8080)
 
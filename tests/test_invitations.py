@@ -0,0 +1,161 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from flask_testing import TestCase
+from itsdangerous import URLSafeSerializer
+from sqlalchemy import select, update
+
+from app import create_app
+from app.config import INSECURE_SECRET_KEY
+from app.invitations import (authorize_invite, bulk_invite, generate_invite_token, invite_revocations,
+                             signed_invites_enabled)
+from app.migrations import upgrade_database
+from app.models import db, FeedbackGiver, FeedbackStats, OutboxMessage, User
+
+MAX_AGE = 3600
+
+
+class InvitationTestCase(TestCase):
+    secret_key = 'test'
+
+    def create_app(self):
+        self.db_dir = tempfile.TemporaryDirectory()
+        return create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.db_dir.name, 'test.db')}",
+            'LLM_BACKEND': 'fake',
+            'STARTUP_MODE': 'lazy',
+            'MAIL_WORKER_ENABLED': False,
+            'METRICS_ENABLED': False,
+            'SECRET_KEY': self.secret_key,
+            'INVITE_TOKEN_MAX_AGE': MAX_AGE,
+            'SERVER_NAME': 'localhost',
+        })
+
+    def setUp(self):
+        upgrade_database()
+        user = User(username='owner', email='owner@example.com', password='secret',
+                    first_name='Owner', last_name='User')
+        db.session.add_all([user, FeedbackStats(user=user)])
+        db.session.flush()
+        self.giver = FeedbackGiver(user_id=user.id, email='giver@example.com', token='legacy-token')
+        db.session.add(self.giver)
+        db.session.commit()
+        self.user_id = user.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.db_dir.cleanup()
+
+    def complete(self, giver_id, completed_at):
+        # As another worker ending the chat would
+        db.session.execute(update(FeedbackGiver).where(FeedbackGiver.id == giver_id)
+                           .values(completed=True, completed_at=completed_at))
+        db.session.commit()
+
+
+class SignedInviteTest(InvitationTestCase):
+    """Signed tokens are checked without the database, except for revocations."""
+
+    def test_valid_token_is_accepted(self):
+        claims, reason = authorize_invite(generate_invite_token(self.giver.id, self.user_id))
+        self.assertIsNone(reason)
+        self.assertEqual((claims.giver_id, claims.user_id), (self.giver.id, self.user_id))
+        self.assertAlmostEqual(claims.expires_at, time.time() + MAX_AGE, delta=5)
+
+    def test_tampered_token_is_invalid(self):
+        signature = generate_invite_token(self.giver.id, self.user_id).rsplit('.', 1)[1]
+        payload = generate_invite_token(self.giver.id + 1, self.user_id).rsplit('.', 1)[0]
+        self.assertEqual(authorize_invite(f'{payload}.{signature}'), (None, 'invalid'))
+
+    def test_token_signed_with_another_key_is_invalid(self):
+        forged = URLSafeSerializer('other', salt='feedback-invite-salt').dumps(
+            {'g': self.giver.id, 'u': self.user_id, 'e': int(time.time() + MAX_AGE)})
+        self.assertEqual(authorize_invite(forged), (None, 'invalid'))
+
+    def test_expired_token_is_invalid(self):
+        token = generate_invite_token(self.giver.id, self.user_id, max_age=-1)
+        self.assertEqual(authorize_invite(token), (None, 'invalid'))
+
+    def test_revoked_token_is_completed(self):
+        token = generate_invite_token(self.giver.id, self.user_id)
+        invite_revocations.revoke(self.giver.id)
+        self.assertEqual(authorize_invite(token), (None, 'completed'))
+
+    def test_end_chat_revokes_token(self):
+        token = generate_invite_token(self.giver.id, self.user_id)
+        response = self.client.post(f'/feedback/feedback_page?token={token}', data={'end_chat': '1'})
+        self.assertStatus(response, 302)
+        self.assertEqual(authorize_invite(token), (None, 'completed'))
+
+    def test_completion_by_another_worker_is_picked_up_on_refresh(self):
+        token = generate_invite_token(self.giver.id, self.user_id)
+        self.assertIsNone(authorize_invite(token)[1])
+        self.complete(self.giver.id, datetime.now(timezone.utc))
+        invite_revocations.refresh()
+        self.assertEqual(authorize_invite(token), (None, 'completed'))
+
+    def test_first_load_skips_completions_older_than_max_age(self):
+        self.complete(self.giver.id, datetime.now(timezone.utc) - timedelta(seconds=2 * MAX_AGE))
+        invite_revocations.refresh()
+        self.assertFalse(invite_revocations.is_revoked(self.giver.id))
+
+    def test_refresh_prunes_revocations_older_than_max_age(self):
+        invite_revocations.refresh()
+        invite_revocations.revoke(self.giver.id)
+        later = time.time() + MAX_AGE + 60
+        with mock.patch('time.time', return_value=later):
+            invite_revocations.refresh()
+        self.assertFalse(invite_revocations.is_revoked(self.giver.id))
+
+    def test_invitation_email_carries_signed_token(self):
+        with self.app.test_request_context():
+            [result] = bulk_invite(self.user_id, ['new@example.com'])
+        self.assertEqual(result.status, 'invited')
+        giver_id = db.session.scalar(select(FeedbackGiver.id).filter_by(email='new@example.com'))
+        body = db.session.scalar(select(OutboxMessage.body).filter_by(recipients='new@example.com'))
+        token = body.split('token=')[1].split()[0]
+        self.assertEqual(authorize_invite(token)[0].giver_id, giver_id)
+
+
+class LegacyInviteTest(InvitationTestCase):
+    """With the public default SECRET_KEY only database tokens are accepted."""
+
+    secret_key = INSECURE_SECRET_KEY
+
+    def test_signed_tokens_are_disabled(self):
+        self.assertFalse(signed_invites_enabled())
+        with self.assertRaises(RuntimeError):
+            generate_invite_token(self.giver.id, self.user_id)
+
+    def test_token_signed_with_default_key_is_invalid(self):
+        forged = URLSafeSerializer(INSECURE_SECRET_KEY, salt='feedback-invite-salt').dumps(
+            {'g': self.giver.id, 'u': self.user_id, 'e': int(time.time() + MAX_AGE)})
+        self.assertEqual(authorize_invite(forged), (None, 'invalid'))
+
+    def test_database_token_is_looked_up(self):
+        claims, reason = authorize_invite('legacy-token')
+        self.assertIsNone(reason)
+        self.assertEqual(claims, (self.giver.id, self.user_id, None))
+        self.assertEqual(authorize_invite('unknown-token'), (None, 'invalid'))
+
+    def test_completed_database_token_is_refused(self):
+        self.complete(self.giver.id, datetime.now(timezone.utc))
+        self.assertEqual(authorize_invite('legacy-token'), (None, 'completed'))
+
+    def test_invitation_email_carries_database_token(self):
+        with self.app.test_request_context():
+            [result] = bulk_invite(self.user_id, ['new@example.com'])
+        self.assertEqual(result.status, 'invited')
+        token = db.session.scalar(select(FeedbackGiver.token).filter_by(email='new@example.com'))
+        body = db.session.scalar(select(OutboxMessage.body).filter_by(recipients='new@example.com'))
+        self.assertIn(f'token={token}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+
+from flask_testing import TestCase
+from sqlalchemy import event, insert
+
+from app import create_app
+from app.migrations import upgrade_database
+from app.models import db, Feedback, FeedbackGiver, FeedbackStats, User
+
+FEEDBACK_ROWS = 120
+
+
+class FeedbackListingQueryCountTest(TestCase):
+    """Feedback pages cost the same number of statements however deep they are."""
+
+    def create_app(self):
+        self.db_dir = tempfile.TemporaryDirectory()
+        return create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.db_dir.name, 'test.db')}",
+            'LLM_BACKEND': 'fake',
+            'STARTUP_MODE': 'lazy',
+            'MAIL_WORKER_ENABLED': False,
+            'METRICS_ENABLED': False,
+            'SECRET_KEY': 'test',
+            'FEEDBACK_PAGE_SIZE': 10,
+        })
+
+    def setUp(self):
+        upgrade_database()
+        user = User(username='owner', email='owner@example.com', password='secret',
+                    first_name='Owner', last_name='User')
+        db.session.add_all([user, FeedbackStats(user=user)])
+        db.session.commit()
+        self.user_id = user.id
+        giver_ids = db.session.scalars(
+            insert(FeedbackGiver).returning(FeedbackGiver.id, sort_by_parameter_order=True),
+            [{'user_id': user.id, 'email': f'giver{i}@example.com', 'token': f'token-{i}', 'completed': True}
+             for i in range(FEEDBACK_ROWS)]
+        ).all()
+        feedback_ids = db.session.scalars(
+            insert(Feedback).returning(Feedback.id, sort_by_parameter_order=True),
+            [{'user_id': user.id, 'giver_id': giver_id, 'content': f'Transcript {giver_id} ' * 50}
+             for giver_id in giver_ids]
+        ).all()
+        db.session.commit()
+        # A page boundary deep in the list, well past the first page
+        self.deep_before = sorted(feedback_ids)[15]
+
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.user_id)
+            session['_fresh'] = True
+        # Prime the identity cache so every measured request sees the same state
+        self.client.get('/dashboard/api/feedback')
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+        db.session.remove()
+        db.engine.dispose()
+        self.db_dir.cleanup()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def count_queries(self, path):
+        # The test keeps one app context, so start each request with an empty
+        # session as a real request would
+        db.session.remove()
+        self.statements.clear()
+        response = self.client.get(path)
+        self.assert200(response)
+        return len(self.statements)
+
+    def test_dashboard_pages_cost_constant_queries(self):
+        first = self.count_queries('/dashboard/dashboard')
+        deep = self.count_queries(f'/dashboard/dashboard?before={self.deep_before}')
+        self.assertEqual(first, deep)
+        # The page, the stats row and the rollup
+        self.assertEqual(first, 3)
+
+    def test_api_pages_cost_one_query(self):
+        self.assertEqual(self.count_queries('/dashboard/api/feedback'), 1)
+        self.assertEqual(self.count_queries(f'/dashboard/api/feedback?before={self.deep_before}'), 1)
+
+    def test_api_walks_every_page(self):
+        seen, before = [], None
+        while True:
+            path = '/dashboard/api/feedback?limit=25' + (f'&before={before}' if before else '')
+            body = self.client.get(path).get_json()
+            seen.extend(item['id'] for item in body['items'])
+            before = body['next_before']
+            if before is None:
+                break
+        self.assertEqual(len(seen), FEEDBACK_ROWS)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_negative_limit_returns_one_row(self):
+        body = self.client.get('/dashboard/api/feedback?limit=-5').get_json()
+        self.assertEqual(len(body['items']), 1)
+        self.assertEqual(body['next_before'], body['items'][0]['id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
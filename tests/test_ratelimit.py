@@ -0,0 +1,262 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flask_testing import TestCase
+from werkzeug.test import EnvironBuilder
+
+from app import create_app
+from app.asgi import AsyncChatApp
+from app.conversations import conversation_store
+from app.invitations import generate_invite_token
+from app.llm import LLMError
+from app.migrations import upgrade_database
+from app.models import db, FeedbackGiver, FeedbackStats, User
+from app.ratelimit import DatabaseBackend, MemoryBackend, Rule, rate_limiter
+
+# Buckets that do not noticeably refill while a test runs
+SLOW = 1 / 86400
+
+
+class AppTestCase(TestCase):
+    config = {}
+
+    def create_app(self):
+        self.db_dir = tempfile.TemporaryDirectory()
+        return create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.db_dir.name, 'test.db')}",
+            'LLM_BACKEND': 'fake',
+            'FAKE_LLM_FIRST_TOKEN_DELAY': 0.0,
+            'FAKE_LLM_TOKEN_DELAY': 0.0,
+            'STARTUP_MODE': 'lazy',
+            'MAIL_WORKER_ENABLED': False,
+            'METRICS_ENABLED': False,
+            'SECRET_KEY': 'test',
+            **self.config,
+        })
+
+    def setUp(self):
+        upgrade_database()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.db_dir.cleanup()
+
+
+class TakeTests:
+    """Behaviour every rate limit backend shares; ``make_backend`` returns a fresh one."""
+
+    def test_take_debits_every_bucket(self):
+        backend = self.make_backend()
+        small, large = Rule(1, SLOW), Rule(5, SLOW)
+        self.assertIsNone(backend.take([('small', small), ('large', large)]))
+        self.assertEqual(backend.take([('small', small)])[0], 'small')
+        for _ in range(4):
+            self.assertIsNone(backend.take([('large', large)]))
+        self.assertEqual(backend.take([('large', large)])[0], 'large')
+
+    def test_refused_take_debits_no_bucket(self):
+        backend = self.make_backend()
+        large, small = Rule(5, SLOW), Rule(1, SLOW)
+        self.assertIsNone(backend.take([('large', large), ('small', small)]))
+        # The empty bucket comes last, after the first one was already debited
+        self.assertEqual(backend.take([('large', large), ('small', small)])[0], 'small')
+        for _ in range(4):
+            self.assertIsNone(backend.take([('large', large)]))
+        self.assertEqual(backend.take([('large', large)])[0], 'large')
+
+    def test_retry_after_is_time_until_next_token(self):
+        backend = self.make_backend()
+        rule = Rule(2, 0.5)
+        self.assertIsNone(backend.take([('key', rule)]))
+        self.assertIsNone(backend.take([('key', rule)]))
+        key, retry_after = backend.take([('key', rule)])
+        self.assertEqual(key, 'key')
+        self.assertAlmostEqual(retry_after, 2.0, delta=0.1)
+
+    def test_cost_is_taken_at_once(self):
+        backend = self.make_backend()
+        rule = Rule(3, SLOW)
+        self.assertIsNone(backend.take([('key', rule)], cost=2))
+        self.assertEqual(backend.take([('key', rule)], cost=2)[0], 'key')
+        self.assertIsNone(backend.take([('key', rule)]))
+
+
+class MemoryBackendTest(TakeTests, unittest.TestCase):
+
+    def make_backend(self):
+        return MemoryBackend()
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        backend = MemoryBackend(max_keys=2)
+        rule = Rule(1, SLOW)
+        for key in ('a', 'b', 'c'):
+            self.assertIsNone(backend.take([(key, rule)]))
+        # 'a' was dropped and starts over with a full bucket
+        self.assertIsNone(backend.take([('a', rule)]))
+        self.assertEqual(backend.take([('c', rule)])[0], 'c')
+
+
+class DatabaseBackendTest(TakeTests, AppTestCase):
+
+    def make_backend(self):
+        return DatabaseBackend(prune_probability=0)
+
+
+class AdmissionTest(AppTestCase):
+    """Every admitted chat turn gives its admission slot back, however it ends."""
+
+    config = {
+        'RATE_LIMIT_INVITE': '2/minute',
+        'LLM_ADMISSION_CAPACITY': 1,
+        'LLM_ADMISSION_RETRY_AFTER': 2.5,
+    }
+
+    def setUp(self):
+        super().setUp()
+        user = User(username='owner', email='owner@example.com', password='secret',
+                    first_name='Owner', last_name='User')
+        db.session.add_all([user, FeedbackStats(user=user)])
+        db.session.flush()
+        giver = FeedbackGiver(user_id=user.id, email='giver@example.com', token='legacy-token')
+        db.session.add(giver)
+        db.session.commit()
+        self.giver_id = giver.id
+        # The store is shared by every app in the test run, and so are giver ids
+        conversation_store.evict(giver.id)
+        self.token = generate_invite_token(giver.id, user.id)
+        self.in_flight = rate_limiter._in_flight
+
+    def chat(self, message='Hello'):
+        return self.client.post(f'/feedback/feedback_page?token={self.token}', data={'message': message})
+
+    def stream(self, message='Hello'):
+        return self.client.post(f'/feedback/feedback_stream?token={self.token}', data={'message': message})
+
+    def assertReleased(self):
+        self.assertEqual(rate_limiter._in_flight, self.in_flight)
+
+    def test_chat_turn(self):
+        self.assert200(self.chat())
+        self.assertReleased()
+        self.assertEqual(len(conversation_store.history(self.giver_id)), 2)
+
+    def test_chat_turn_llm_error(self):
+        with mock.patch('app.feedback.complete_chat', side_effect=LLMError('down')):
+            self.assert200(self.chat())
+        self.assertReleased()
+        self.assertEqual(conversation_store.history(self.giver_id), [])
+
+    def test_chat_turn_prompt_error(self):
+        with mock.patch('app.feedback.build_prompt', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            self.chat()
+        self.assertReleased()
+
+    def test_stream(self):
+        response = self.stream()
+        self.assertIn(b'event: done', response.data)
+        response.close()
+        self.assertReleased()
+        self.assertEqual(len(conversation_store.history(self.giver_id)), 2)
+
+    def test_stream_llm_error(self):
+        def failing_stream(_messages):
+            yield 'Partial'
+            raise LLMError('down')
+
+        with mock.patch('app.feedback.stream_chat', failing_stream):
+            response = self.stream()
+            self.assertIn(b'event: error', response.data)
+            response.close()
+        self.assertReleased()
+
+    def test_stream_prompt_error(self):
+        with mock.patch('app.feedback.build_prompt', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            self.stream()
+        self.assertReleased()
+
+    def test_stream_closed_before_first_chunk(self):
+        # The client went away before the server started sending, so the
+        # server closes the response without reading it; the test client
+        # always reads the first chunk, hence the direct WSGI call
+        environ = EnvironBuilder(path='/feedback/feedback_stream', method='POST',
+                                 query_string={'token': self.token}, data={'message': 'Hello'}).get_environ()
+        self.app(environ, lambda *_: None).close()
+        self.assertReleased()
+
+    def test_stream_closed_after_first_chunk(self):
+        response = self.stream()
+        next(response.response)
+        response.close()
+        self.assertReleased()
+
+    def test_rate_limited_turn_has_retry_after(self):
+        self.assert200(self.chat())
+        self.assert200(self.chat())
+        response = self.chat()
+        self.assertStatus(response, 429)
+        # 2/minute gives a token back every 30 seconds
+        self.assertEqual(response.headers['Retry-After'], '30')
+        self.assertReleased()
+
+        response = self.stream()
+        self.assertStatus(response, 429)
+        self.assertEqual(response.headers['Retry-After'], '30')
+        self.assertReleased()
+
+    def test_busy_turn_has_retry_after(self):
+        self.assertIsNone(rate_limiter.admit(None, None, None))
+        try:
+            for response in (self.chat(), self.stream()):
+                self.assertStatus(response, 503)
+                self.assertEqual(response.headers['Retry-After'], '3')
+            self.assertEqual(rate_limiter._in_flight, self.in_flight + 1)
+        finally:
+            rate_limiter.release()
+        self.assertEqual(conversation_store.history(self.giver_id), [])
+
+    def run_async_chat(self, send):
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/feedback/feedback_stream',
+            'query_string': f'token={self.token}'.encode(),
+            'headers': [],
+            'client': ('127.0.0.1', 50000),
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'message=Hello', 'more_body': False}
+
+        asyncio.run(AsyncChatApp(self.app)(scope, receive, send))
+
+    def test_async_stream(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        self.run_async_chat(send)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'event: done', sent[-1]['body'])
+        self.assertReleased()
+
+    def test_async_stream_send_fails(self):
+        for failing in ('http.response.start', 'http.response.body'):
+            async def send(message, failing=failing):
+                if message['type'] == failing:
+                    raise OSError('client went away')
+
+            with self.assertRaises(OSError):
+                self.run_async_chat(send)
+            self.assertReleased()
+
+
+if __name__ == '__main__':
+    unittest.main()